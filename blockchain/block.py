@@ -1,5 +1,6 @@
 import time
 import json
+import orjson
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
@@ -13,10 +14,12 @@ class Block:
     index: int
     transactions: List[Transaction] # Now holds actual Transaction objects
     timestamp: float = field(default_factory=time.time)
-    previous_hash: str = "0"
+    previous_hash: str = "0" * 64
     nonce: int = 0 # Proof-of-Work nonce
     merkle_root: Optional[str] = None
     hash: Optional[str] = None
+    # Memoized to_json() output; blocks are not modified once built, so it never goes stale
+    _json: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         # Calculate Merkle root if not provided
@@ -59,6 +62,12 @@ class Block:
             "nonce": self.nonce,
         }
 
+    def to_json(self) -> bytes:
+        """JSON encoding of to_dict(), computed once and shared by broadcasts and the chain file."""
+        if self._json is None:
+            self._json = orjson.dumps(self.to_dict())
+        return self._json
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Block':
         """Deserializes block from a dictionary."""
@@ -72,9 +81,31 @@ class Block:
             nonce=data['nonce'],
             hash=data['hash'] # Use stored hash
         )
-        # Optional: Verify loaded hash and merkle root
-        # if block.merkle_root != block._calculate_internal_merkle_root():
-        #     print(f"Warning: Merkle root mismatch for loaded block {block.index}")
-        # if block.hash != block._calculate_internal_hash():
-        #      print(f"Warning: Hash mismatch for loaded block {block.index}")
-        return block
\ No newline at end of file
+        # Loaded hash and merkle root are not re-verified here; see verify_against_self()
+        return block
+
+    @classmethod
+    def from_dict_trusted(cls, data: Dict[str, Any]) -> 'Block':
+        """
+        Deserializes a block from trusted storage (e.g. this node's own chain file).
+        Bypasses the dataclass __init__/__post_init__ and sets the fields directly;
+        call verify_against_self() when the block's integrity actually matters.
+        """
+        block = object.__new__(cls)
+        block.__dict__.update(
+            index=data['index'],
+            transactions=[Transaction.from_dict(tx_data) for tx_data in data['transactions']],
+            timestamp=data['timestamp'],
+            previous_hash=data['previous_hash'],
+            nonce=data['nonce'],
+            merkle_root=data['merkle_root'],
+            hash=data['hash'],
+        )
+        return block
+
+    def verify_against_self(self) -> bool:
+        """Recomputes the merkle root and header hash and checks them against the stored values."""
+        return (
+            self.merkle_root == self._calculate_internal_merkle_root() and
+            self.hash == self._calculate_internal_hash()
+        )
\ No newline at end of file
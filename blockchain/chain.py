@@ -1,61 +1,71 @@
-import json
-import time
-import copy
-from typing import List, Set, Optional, Tuple, TYPE_CHECKING
+import orjson
+from typing import Dict, List, Set, Optional, Tuple, Union, TYPE_CHECKING
 
 from .block import Block
 from .consensus import Consensus, ProofOfWork
-from .transaction import Transaction, TransactionInput, TransactionOutput, COINBASE_TX_ID
-from .utils import verify, public_key_to_address, calculate_merkle_root # Added merkle root import
+from .transaction import Transaction
+from .utils import verify, verify_batch, verify_many, public_key_to_address, calculate_merkle_root, COIN # Added merkle root import
 
-if TYPE_CHECKING:
-    from utxo import UTXOSet, UTXOKey
+from .utxo import UTXOOverlay
 
-BLOCK_REWARD = 50.0 # Define block reward constant here or pass it in
+if TYPE_CHECKING:
+    from .utxo import UTXOSet, UTXOKey
+
+BLOCK_REWARD = 50 * COIN # Satoshis; define block reward constant here or pass it in
+
+# Fixed genesis block shared by every node, mined once offline so creating or loading a
+# Chain never runs PoW. It holds a single coinbase-like marker transaction, uses a fixed
+# timestamp (2025-01-01 UTC) and its hash meets difficulty 6, i.e. any difficulty <= 6.
+# Must be regenerated whenever the header, transaction id or Merkle encoding changes.
+GENESIS_BLOCK_DICT = {
+    "index": 0,
+    "timestamp": 1735689600.0,
+    "transactions": [{
+        "transaction_id": "e229a4c60e3e05c4934e94af3ca35a9ed6efc08425c011f3ea56e4f5550c0746",
+        "inputs": [{
+            "transaction_id": "0" * 64,
+            "output_index": -1,
+            "unlock_script": {"data": "Genesis Block Marker"},
+        }],
+        "outputs": [{"amount": 0, "lock_script": "genesis_reward_address_placeholder"}],
+    }],
+    "previous_hash": "0" * 64,
+    "hash": "0000009736dd9ca2fa029f322b9c0ae59b22667c2fc47fd77e769cbdf00e529b",
+    "merkle_root": "e229a4c60e3e05c4934e94af3ca35a9ed6efc08425c011f3ea56e4f5550c0746",
+    "nonce": 25046626,
+}
 
 class Chain:
     """Represents the blockchain: a sequence of blocks."""
     def __init__(self, consensus: Consensus):
         self.blocks: List[Block] = []
         self.consensus: Consensus = consensus
+        self.saved_length = 0 # Leading blocks already in the chain file (see append_to_file)
         # Genesis block creation should not depend on external state
         self._create_genesis_block()
 
     def _create_genesis_block(self):
-        """Creates the first block in the chain."""
+        """
+        Creates the first block in the chain from the precomputed GENESIS_BLOCK_DICT.
+        Raises ValueError if its header does not meet the chain's consensus rules.
+        """
         if not self.blocks:
-            # print("Creating Genesis Block...")
-            # Genesis transactions are often special, maybe pre-funding accounts or just a marker
-            # Here, a simple coinbase-like marker transaction
-            genesis_coinbase_input = TransactionInput(COINBASE_TX_ID, -1, {"data": "Genesis Block Marker"})
-            # You could pre-fund an address here if desired
-            genesis_output = TransactionOutput(0.0, "genesis_reward_address_placeholder")
-            genesis_tx = Transaction(tx_inputs=[genesis_coinbase_input], tx_outputs=[genesis_output])
-
-            timestamp = time.time() # Or a fixed known timestamp like Bitcoin's
-            merkle_root = calculate_merkle_root([genesis_tx.transaction_id])
-            previous_hash = "0" * 64 # Use full length hash
-
-            # Mine the genesis block (nonce might be 0 or require finding)
-            nonce = self.consensus.prove(0, timestamp, previous_hash, merkle_root)
-
-            genesis_block = Block(
-                index=0,
-                transactions=[genesis_tx],
-                timestamp=timestamp,
-                previous_hash=previous_hash,
-                merkle_root=merkle_root,
-                nonce=nonce,
-            )
-            self.blocks.append(genesis_block)
-            # print(f"Genesis block created. Hash: {genesis_block.hash[:10]}...")
+            genesis = Block.from_dict(GENESIS_BLOCK_DICT)
+            # Peers validate the genesis header like any other block, so a difficulty the
+            # fixed genesis does not meet would leave this node unable to sync
+            if not self.consensus.validate_block_header(genesis):
+                raise ValueError(f"Genesis block does not satisfy {self.consensus}; "
+                                 "lower the difficulty or regenerate GENESIS_BLOCK_DICT")
+            self.blocks.append(genesis)
 
     def get_last_block(self) -> Optional[Block]:
         return self.blocks[-1] if self.blocks else None
 
-    def add_block(self, block: Block, utxo_set: 'UTXOSet') -> bool:
+    def add_block(self, block: Block, utxo_set: Union['UTXOSet', UTXOOverlay], signatures_verified: bool = False) -> bool:
         """
-        Validates and adds a block, updating the provided UTXO set.
+        Validates and adds a block, updating the provided UTXO set (or a UTXOOverlay of it).
+        signatures_verified=True skips the input signature checks for callers that already
+        ran them (see block_signatures); ownership and UTXO checks still happen here.
         Returns True if added, False otherwise.
         """
         last_block = self.get_last_block()
@@ -84,18 +94,15 @@ class Chain:
              print(f"Block {block.index} validation failed: Block has no transactions (must have coinbase).")
              return False
 
-        # Check Merkle Root
-        recalculated_merkle_root = calculate_merkle_root([tx.transaction_id for tx in block.transactions])
-        if block.merkle_root != recalculated_merkle_root:
-             # print(f"Block {block.index} validation failed: Merkle root mismatch.")
-             return False
-
-        # Validate individual transactions against a temporary UTXO set state
-        temp_utxo_set = utxo_set.get_copy()
-        total_fees = 0.0
+        # Validate individual transactions against an overlay of the UTXO set
+        temp_utxo_set = UTXOOverlay(utxo_set)
+        total_fees = 0
         coinbase_tx_count = 0
+        tx_ids: List[str] = [] # Gathered during the walk for the Merkle root check
+        signatures: List[Tuple[str, bytes, str]] = [] # Every input's signature, verified once at the end
 
         for i, tx in enumerate(block.transactions):
+            tx_ids.append(tx.transaction_id)
             if tx.is_coinbase():
                 coinbase_tx_count += 1
                 if i != 0:
@@ -105,7 +112,8 @@ class Chain:
                 continue # Skip regular validation for coinbase
 
             # Regular transaction validation against temporary UTXO set
-            is_valid, tx_fee = self.validate_transaction(tx, temp_utxo_set, check_not_in_set=False) # Expect inputs to exist initially
+            is_valid, tx_fee = self.validate_transaction(tx, temp_utxo_set, check_not_in_set=False, # Expect inputs to exist initially
+                                                         deferred_signatures=signatures)
             if not is_valid:
                  print(f"Block {block.index} validation failed: Invalid transaction {tx.transaction_id[:10]}...")
                  return False
@@ -122,103 +130,198 @@ class Chain:
              print(f"Block {block.index} validation failed: Found {coinbase_tx_count} coinbase transactions.")
              return False
 
+        # Check Merkle Root
+        try:
+             merkle_root = calculate_merkle_root(tx_ids)
+        except ValueError: # Transaction id is not a hex digest
+             print(f"Block {block.index} validation failed: Malformed transaction id.")
+             return False
+        if block.merkle_root != merkle_root:
+             # print(f"Block {block.index} validation failed: Merkle root mismatch.")
+             return False
+
+        # Verify all input signatures of the block in one pass (the costliest check, so last)
+        signature_results = [] if signatures_verified else verify_many(signatures)
+        if not all(signature_results):
+             bad_index = signature_results.index(False)
+             print(f"Block {block.index} validation failed: Invalid signature by {signatures[bad_index][0][:10]}...")
+             return False
+
         # TODO: Validate coinbase amount against BLOCK_REWARD + total_fees
 
         # --- If all valid, commit changes ---
-        utxo_set.update_from_block(block) # Update the *real* UTXO set
+        # The overlay already holds every non-coinbase spend/output; add the coinbase
+        # outputs (kept out during validation so they can't be spent in-block) and
+        # apply it to the *real* UTXO set in bulk instead of replaying the block.
+        coinbase_tx = block.transactions[0]
+        for out_idx, out in enumerate(coinbase_tx.outputs):
+             temp_utxo_set.add_utxo(coinbase_tx.transaction_id, out_idx, out)
+        utxo_set.apply_overlay(temp_utxo_set)
         self.blocks.append(block)
         # print(f"Block {block.index} added to chain. UTXOs: {len(utxo_set)}")
         return True
 
-    def validate_transaction(self, transaction: Transaction, utxo_set: 'UTXOSet', check_not_in_set: bool = True) -> Tuple[bool, float]:
+    @staticmethod
+    def block_signatures(block: Block) -> Optional[List[Tuple[str, bytes, str]]]:
+        """
+        (public_key, message, signature) triples for every non-coinbase input of a block, for
+        checking without any UTXO state (and so without the node's lock). None if malformed.
+        """
+        triples: List[Tuple[str, bytes, str]] = []
+        for tx in block.transactions:
+            if tx.is_coinbase():
+                continue
+            tx_triples = Chain.transaction_signatures(tx)
+            if tx_triples is None:
+                return None
+            triples.extend(tx_triples)
+        return triples
+
+    @staticmethod
+    def transaction_signatures(tx: Transaction) -> Optional[List[Tuple[str, bytes, str]]]:
+        """(public_key, message, signature) triples for one non-coinbase transaction. None if malformed."""
+        try:
+            data_to_sign = tx.get_data_to_sign()
+        except Exception:
+            return None
+        triples: List[Tuple[str, bytes, str]] = []
+        for inp in tx.inputs:
+            if not isinstance(inp.unlock_script, dict) or \
+               'signature' not in inp.unlock_script or \
+               'public_key' not in inp.unlock_script:
+                return None
+            triples.append((inp.unlock_script['public_key'], data_to_sign, inp.unlock_script['signature']))
+        return triples
+
+    def validate_transaction(self, transaction: Transaction, utxo_set: 'UTXOSet', check_not_in_set: bool = True,
+                             deferred_signatures: Optional[List[Tuple[str, bytes, str]]] = None) -> Tuple[bool, int]:
         """
         Validates a single non-coinbase transaction against the provided UTXO set.
-        Returns: Tuple (is_valid: bool, fee: float)
+        If deferred_signatures is given, (public_key, message, signature) triples are appended
+        to it for the caller to verify in bulk instead of being checked here.
+        Returns: Tuple (is_valid: bool, fee: int satoshis)
         """
-        if transaction.is_coinbase(): return False, 0.0 # Should not be called for coinbase
+        if transaction.is_coinbase(): return False, 0 # Should not be called for coinbase
 
-        total_input_value = 0.0
+        total_input_value = 0
         spent_utxo_keys: List[UTXOKey] = [] # Track spent UTXOs within this tx to prevent double spending *same* UTXO
+        signatures: List[Tuple[str, str]] = [] # (public_key_hex, signature_hex) per input
+        derived_addresses: Dict[str, str] = {} # public_key_hex -> address, inputs usually share one key
 
         try:
             data_to_sign = transaction.get_data_to_sign()
         except Exception as e:
              print(f"Error creating data to sign for tx {transaction.transaction_id[:10]}: {e}")
-             return False, 0.0
+             return False, 0
 
         # Validate Inputs
-        if not transaction.inputs: return False, 0.0 # Must have inputs
+        if not transaction.inputs: return False, 0 # Must have inputs
         for i, inp in enumerate(transaction.inputs):
             utxo_key = (inp.transaction_id, inp.output_index)
 
             # Prevent spending the same UTXO twice in one transaction
             if utxo_key in spent_utxo_keys:
                  print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Input {i} references UTXO {utxo_key} already spent in this transaction.")
-                 return False, 0.0
+                 return False, 0
 
             spent_utxo = utxo_set.get_utxo(inp.transaction_id, inp.output_index)
             if spent_utxo is None:
                 # print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Input {i} references non-existent/spent UTXO {utxo_key}.")
-                return False, 0.0 # Input UTXO must exist
+                return False, 0 # Input UTXO must exist
 
             # Verify Signature and Ownership
             if not isinstance(inp.unlock_script, dict) or \
                'signature' not in inp.unlock_script or \
                'public_key' not in inp.unlock_script:
                  print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Input {i} unlock_script invalid format.")
-                 return False, 0.0
+                 return False, 0
 
             pub_key_hex = inp.unlock_script['public_key']
             signature_hex = inp.unlock_script['signature']
-            derived_address = public_key_to_address(pub_key_hex)
+            derived_address = derived_addresses.get(pub_key_hex)
+            if derived_address is None:
+                 derived_address = derived_addresses[pub_key_hex] = public_key_to_address(pub_key_hex)
 
             if spent_utxo.lock_script != derived_address:
                  print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Input {i} pubkey does not match UTXO address {spent_utxo.lock_script[:10]} != {derived_address[:10]}.")
-                 return False, 0.0
-
-            if not verify(pub_key_hex, data_to_sign, signature_hex):
-                print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Input {i} invalid signature.")
-                return False, 0.0
+                 return False, 0
 
+            signatures.append((pub_key_hex, signature_hex))
             total_input_value += spent_utxo.amount
             spent_utxo_keys.append(utxo_key) # Mark as spent for this transaction
 
+        # All inputs sign the same message, so verify them in one batch and only
+        # fall back to per-input checks to report which one is bad.
+        if deferred_signatures is not None:
+            deferred_signatures.extend((pub_key_hex, data_to_sign, signature_hex) for pub_key_hex, signature_hex in signatures)
+        elif not verify_batch(signatures, data_to_sign):
+            for i, (pub_key_hex, signature_hex) in enumerate(signatures):
+                if not verify(pub_key_hex, data_to_sign, signature_hex):
+                    print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Input {i} invalid signature.")
+                    break
+            return False, 0
+
         # Validate Outputs
-        if not transaction.outputs: return False, 0.0 # Must have outputs
-        total_output_value = 0.0
+        if not transaction.outputs: return False, 0 # Must have outputs
+        total_output_value = 0
         for i, out in enumerate(transaction.outputs):
             if out.amount < 0:
                 print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Output {i} has negative amount {out.amount}.")
-                return False, 0.0
+                return False, 0
             total_output_value += out.amount
 
-        # Check Value Conservation (allow for potential float inaccuracies)
-        fee = round(total_input_value - total_output_value, 8)
+        # Check Value Conservation (exact: amounts are integer satoshis)
+        fee = total_input_value - total_output_value
         if fee < 0:
-             print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Output value ({total_output_value:.8f}) > Input value ({total_input_value:.8f}).")
-             return False, 0.0 # Cannot spend more than you have
+             print(f"Validation Error (Tx: {transaction.transaction_id[:10]}): Output value ({total_output_value}) > Input value ({total_input_value}).")
+             return False, 0 # Cannot spend more than you have
 
         # All checks passed
         return True, fee
 
     # --- Persistence ---
+    # Chain files are JSON Lines: one serialized block per line, streamed in both
+    # directions so the whole chain never has to exist as one in-memory document.
     def save_to_file(self, path: str):
         try:
-            data = {"chain": [block.to_dict() for block in self.blocks]}
-            with open(path, 'w') as f:
-                json.dump(data, f, indent=2)
+            blocks = self.blocks[:] # Blocks are only ever appended, so a slice is a consistent prefix
+            with open(path, 'wb') as f:
+                for block in blocks:
+                    f.write(block.to_json())
+                    f.write(b'\n')
+            self.saved_length = len(blocks)
             # print(f"Chain saved to {path}")
         except IOError as e:
             print(f"Error saving chain to {path}: {e}")
 
+    def append_to_file(self, path: str):
+        """
+        Appends only the blocks added since the last save/load, so persisting costs O(new blocks)
+        rather than a rewrite of the whole file. Writes the full file if nothing was saved yet.
+        Callers serialize calls for the same chain; chain mutations may run concurrently.
+        """
+        if not self.saved_length:
+            self.save_to_file(path)
+            return
+        blocks = self.blocks[self.saved_length:]
+        if not blocks:
+            return
+        try:
+            with open(path, 'ab') as f:
+                f.write(b''.join(block.to_json() + b'\n' for block in blocks))
+            self.saved_length += len(blocks)
+        except IOError as e:
+            print(f"Error saving chain to {path}: {e}")
+
     @classmethod
     def load_from_file(cls, path: str, consensus: Consensus) -> Optional['Chain']:
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
+            with open(path, 'rb') as f:
+                # Our own file: skip per-block re-derivation, only the tip is verified below
+                blocks = [Block.from_dict_trusted(orjson.loads(line)) for line in f if line.strip()]
 
             chain = cls(consensus) # Create instance with empty blocks
-            chain.blocks = [Block.from_dict(block_data) for block_data in data.get('chain', [])]
+            chain.blocks = blocks
 
             if not chain.blocks:
                  print(f"Warning: Loaded chain file {path} was empty or invalid. Starting fresh.")
@@ -227,13 +330,20 @@ class Chain:
                  print(f"Warning: Loaded chain file {path} has invalid genesis. Starting fresh.")
                  chain.blocks = [] # Clear invalid blocks
                  chain._create_genesis_block() # Create proper genesis
+            elif not chain.blocks[-1].verify_against_self():
+                 # The tip is what new blocks get built on, so it must be intact
+                 print(f"Warning: Loaded chain file {path} has a corrupted tip block. Starting fresh.")
+                 chain.blocks = []
+                 chain._create_genesis_block()
+            else:
+                 chain.saved_length = len(chain.blocks) # The file holds exactly these; new blocks are appended
 
             # print(f"Chain loaded from {path}. Length: {len(chain.blocks)}")
             # UTXO set needs separate rebuilding after load
             return chain
         except FileNotFoundError:
             return None
-        except (IOError, json.JSONDecodeError, TypeError, KeyError) as e:
+        except (IOError, ValueError, TypeError, KeyError) as e: # orjson.JSONDecodeError is a ValueError
             print(f"Error loading or parsing chain from {path}: {e}. Starting fresh.")
             # Fallback to creating a new chain if loading fails badly
             chain = cls(consensus)
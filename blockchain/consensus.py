@@ -1,13 +1,63 @@
 import time
+import hashlib
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from abc import ABC, abstractmethod
-from typing import Any, TYPE_CHECKING
+from typing import Any, Optional, TYPE_CHECKING
 
 # Assuming utils.py is accessible
-from .utils import calculate_block_hash
+from .utils import calculate_block_hash, block_header_prefix, NONCE_STRUCT, MAX_NONCE
 
 if TYPE_CHECKING:
     from .block import Block
 
+def find_nonce(header_prefix: bytes, target: bytes, start: int, stop: int, step: int = 1) -> Optional[int]:
+    """
+    Scans nonces in range(start, stop, step) for one whose header hash is <= target.
+    Returns the nonce, or None if the range is exhausted.
+    """
+    # The 80-byte header prefix is identical for every attempt, so absorb it once
+    # and clone the hasher state per nonce; only the 8-byte nonce tail is hashed.
+    # hashlib's OpenSSL backend already picks SHA-NI/AVX2 code at runtime; what is
+    # left per attempt is interpreter overhead, so keep lookups out of the loop.
+    clone_prefix_state = hashlib.sha256(header_prefix).copy
+    pack_nonce = NONCE_STRUCT.pack
+    for nonce in range(start, stop, step):
+        hasher = clone_prefix_state()
+        hasher.update(pack_nonce(nonce))
+        if hasher.digest() <= target:
+            return nonce
+    return None
+
+NONCE_POLL_INTERVAL = 4096 # Attempts a worker makes between checks of the search generation
+
+_search_generation: Optional['multiprocessing.sharedctypes.Synchronized'] = None # Set in each pool worker
+
+def _init_nonce_worker(generation: 'multiprocessing.sharedctypes.Synchronized'):
+    """Pool initializer: keeps the shared generation counter used to cancel searches."""
+    global _search_generation
+    # Ctrl+C reaches the whole process group; the node stops workers itself via close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _search_generation = generation
+
+def _find_nonce_task(header_prefix: bytes, target: bytes, start: int, step: int, generation: int) -> Optional[int]:
+    """
+    Pool task: scans nonces start, start+step, ... until one is found or the search
+    generation moves on (another worker found a nonce, or the pool is closing).
+    """
+    batch_span = NONCE_POLL_INTERVAL * step
+    for batch_start in range(start, MAX_NONCE + 1, batch_span):
+        if _search_generation.value != generation:
+            return None
+        nonce = find_nonce(header_prefix, target, batch_start, min(batch_start + batch_span, MAX_NONCE + 1), step)
+        if nonce is not None:
+            return nonce
+    return None
+
+
 class Consensus(ABC):
     """Abstract Base Class for consensus algorithms."""
 
@@ -21,26 +71,89 @@ class Consensus(ABC):
         """Validate a block's header based on consensus rules (e.g., PoW)."""
         pass
 
+    def close(self):
+        """Releases any resources held by the algorithm (worker processes etc.)."""
+        pass
+
 
 class ProofOfWork(Consensus):
     """Simple Proof-of-Work implementation."""
-    def __init__(self, difficulty: int = 4):
+    def __init__(self, difficulty: int = 4, workers: int = 1):
         if difficulty < 1:
             raise ValueError("Difficulty must be at least 1")
+        if workers < 1:
+            raise ValueError("Workers must be at least 1")
         self.difficulty = difficulty
+        self.workers = workers # Processes used for the nonce search (1 = search in the calling thread)
+        self._pool: Optional[ProcessPoolExecutor] = None # Started on the first parallel search, reused after
+        self._pool_lock = threading.Lock()
+        self._generation = None # Shared counter; bumping it cancels the running parallel search
         self.target_prefix = '0' * difficulty
+        # Largest raw digest with `difficulty` leading zero hex digits; lets the
+        # nonce search compare digests directly without hex-encoding each attempt.
+        self.target = ((1 << (256 - 4 * difficulty)) - 1).to_bytes(32, 'big')
         print(f"ProofOfWork initialized with difficulty {difficulty} (target: '{self.target_prefix}...')")
 
     def prove(self, index: int, timestamp: float, previous_hash: str, merkle_root: str) -> int:
         """Finds a nonce (integer proof) that results in a hash with leading zeros."""
-        nonce = 0
-        while True:
-            hash_attempt = calculate_block_hash(index, timestamp, previous_hash, merkle_root, nonce)
-            if hash_attempt.startswith(self.target_prefix):
-                return nonce
-            nonce += 1
-            # Optional: Add a tiny sleep if running on a single thread to prevent UI freeze
-            # if nonce % 100000 == 0: time.sleep(0.001)
+        header_prefix = block_header_prefix(index, timestamp, previous_hash, merkle_root)
+        if self.workers > 1:
+            return self._prove_parallel(header_prefix)
+        nonce = find_nonce(header_prefix, self.target, 0, MAX_NONCE + 1)
+        if nonce is None:
+            raise RuntimeError(f"No valid nonce found for block {index}")
+        return nonce
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """
+        Returns the worker pool, starting it on first use. Workers use the spawn start
+        method: forking a node that already runs network/API threads can copy held locks
+        into the child. Spawning is slow, so the pool is kept for the node's lifetime.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                ctx = multiprocessing.get_context("spawn")
+                self._generation = ctx.Value('Q', 0)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                                 initializer=_init_nonce_worker, initargs=(self._generation,))
+            return self._pool
+
+    def _next_generation(self) -> int:
+        with self._generation.get_lock():
+            self._generation.value += 1
+            return self._generation.value
+
+    def _prove_parallel(self, header_prefix: bytes) -> int:
+        """
+        Splits the nonce search across worker processes (sidestepping the GIL).
+        Worker i scans nonces i, i+N, i+2N, ...; the first hit stops the others.
+        """
+        pool = self._get_pool()
+        generation = self._next_generation()
+        try:
+            futures = [pool.submit(_find_nonce_task, header_prefix, self.target, worker_id, self.workers, generation)
+                       for worker_id in range(self.workers)]
+            # A worker that dies breaks the pool, so result() raises instead of waiting forever
+            for future in as_completed(futures):
+                nonce = future.result()
+                if nonce is not None:
+                    return nonce
+        except BrokenProcessPool as e:
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None # Start a fresh pool on the next search
+            raise RuntimeError(f"Nonce search worker died: {e}") from e
+        finally:
+            self._next_generation() # Stop the remaining workers
+        raise RuntimeError("No valid nonce found (search exhausted or cancelled)")
+
+    def close(self):
+        """Cancels any running nonce search and stops the worker processes."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            self._next_generation()
+            pool.shutdown(wait=True, cancel_futures=True)
 
     def validate_block_header(self, block: 'Block') -> bool:
         """Validates the block's hash meets the difficulty target."""
@@ -66,4 +179,4 @@ class ProofOfWork(Consensus):
         return True
 
     def __str__(self):
-        return f"ProofOfWork(difficulty={self.difficulty})"
+        return f"ProofOfWork(difficulty={self.difficulty}, workers={self.workers})"
@@ -1,8 +1,10 @@
-from typing import Dict, List, Optional
+import heapq
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 
 # Assuming transaction.py and utils.py are accessible
 from .transaction import Transaction
-from .utils import verify
+from .utils import verify, verify_batch
 
 class Mempool:
     """Stores pending transactions."""
@@ -10,31 +12,79 @@ class Mempool:
         # Stores transaction_id -> Transaction object
         self.pending_transactions: Dict[str, Transaction] = {}
         self.max_size = max_size
-
-    def add_transaction(self, transaction: Transaction) -> bool:
+        # Fee index: transaction_id -> (fee, -arrival_seq, transaction_id).
+        # Ordering the tuples ranks higher fees first and, on ties, earlier arrivals.
+        self._fee_entries: Dict[str, Tuple[int, int, str]] = {}
+        # Min-heap over the same entries (lowest fee at the top) used for eviction.
+        # Entries of removed transactions are skipped lazily.
+        self._eviction_heap: List[Tuple[int, int, str]] = []
+        self._arrival_seq = 0
+        # Ids removed after being mined, so re-gossiped copies are dropped before
+        # signature checks. Two generations are kept and rotated to bound memory.
+        self._recently_mined: Set[str] = set()
+        self._recently_mined_prev: Set[str] = set()
+        self._recently_mined_cap = max_size * 4
+        # Guards all of the above; the node's P2P, mining and API threads share one mempool
+        self._lock = threading.RLock()
+
+    def add_transaction(self, transaction: Transaction, fee: int = 0, verify_signatures: bool = True) -> bool:
         """
         Adds a transaction to the mempool after basic validation.
+        When the mempool is full, the lowest-fee transaction is evicted if `fee` beats it.
+        verify_signatures=False skips the ECDSA checks for transactions this node signed
+        itself (they are verified again before any block containing them is applied).
         Returns True if added, False otherwise.
         """
-        if transaction.transaction_id in self.pending_transactions:
-            # print(f"Transaction {transaction.transaction_id[:10]}... already in mempool.")
-            return False # Already exists
-
-        if len(self.pending_transactions) >= self.max_size:
-            print("Mempool is full. Transaction rejected.")
-            # TODO: Implement eviction strategy (e.g., lowest fee)
-            return False
+        tx_id = transaction.transaction_id
+        with self._lock:
+            if not self._admission_check(tx_id, fee):
+                return False
 
-        # Basic validation (structure, signatures) - NOT UTXO validity
-        if not self._validate_transaction_basic(transaction):
+        # Basic validation (structure, signatures) - NOT UTXO validity.
+        # Runs outside the lock so other threads aren't held up by signature checks.
+        if not self._validate_transaction_basic(transaction, verify_signatures):
             print(f"Transaction {transaction.transaction_id[:10]}... failed basic validation. Rejected.")
             return False
 
-        self.pending_transactions[transaction.transaction_id] = transaction
+        with self._lock:
+            if not self._admission_check(tx_id, fee): # State may have changed meanwhile
+                return False
+            if len(self.pending_transactions) >= self.max_size:
+                evicted_id = heapq.heappop(self._eviction_heap)[2] # Live: _admission_check peeked it
+                self.pending_transactions.pop(evicted_id, None)
+                self._fee_entries.pop(evicted_id, None)
+                print(f"Mempool full. Evicted lowest-fee transaction {evicted_id[:10]}...")
+
+            self._arrival_seq += 1
+            entry = (fee, -self._arrival_seq, tx_id)
+            self.pending_transactions[tx_id] = transaction
+            self._fee_entries[tx_id] = entry
+            heapq.heappush(self._eviction_heap, entry)
         # print(f"Added transaction {transaction.transaction_id[:10]}... to mempool.")
         return True
 
-    def _validate_transaction_basic(self, transaction: Transaction) -> bool:
+    def _admission_check(self, tx_id: str, fee: int) -> bool:
+        """Checks a transaction id/fee against the current pool state. Caller holds the lock."""
+        if tx_id in self.pending_transactions:
+            # print(f"Transaction {tx_id[:10]}... already in mempool.")
+            return False # Already exists
+        if tx_id in self._recently_mined or tx_id in self._recently_mined_prev:
+            return False # Already included in a block
+        if len(self.pending_transactions) >= self.max_size:
+            lowest = self._peek_lowest_fee_entry()
+            if lowest is None or fee <= lowest[0]:
+                print("Mempool is full. Transaction rejected.")
+                return False
+        return True
+
+    def _peek_lowest_fee_entry(self) -> Optional[Tuple[int, int, str]]:
+        """Returns the live lowest-fee entry, discarding stale heap entries on the way."""
+        heap = self._eviction_heap
+        while heap and self._fee_entries.get(heap[0][2]) is not heap[0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _validate_transaction_basic(self, transaction: Transaction, verify_signatures: bool = True) -> bool:
         """Performs basic validation (signatures, format) before adding to mempool."""
         if transaction.is_coinbase():
             print("Error: Coinbase transaction submitted to mempool.")
@@ -47,20 +97,26 @@ class Mempool:
             print("Error: Transaction has no outputs.")
             return False
 
-        data_to_sign = transaction.get_data_to_sign()
+        try:
+            data_to_sign = transaction.get_data_to_sign()
+        except ValueError as e:
+            print(f"Error: Malformed transaction {transaction.transaction_id[:10]}...: {e}")
+            return False
+        signatures: List[Tuple[str, str]] = []
         for i, inp in enumerate(transaction.inputs):
             if not isinstance(inp.unlock_script, dict) or \
                'signature' not in inp.unlock_script or \
                'public_key' not in inp.unlock_script:
                 print(f"Error: Input {i} has invalid unlock_script format.")
                 return False
+            signatures.append((inp.unlock_script['public_key'], inp.unlock_script['signature']))
 
-            sig_hex = inp.unlock_script['signature']
-            pub_key_hex = inp.unlock_script['public_key']
-
-            if not verify(pub_key_hex, data_to_sign, sig_hex):
-                print(f"Error: Invalid signature for input {i} in transaction {transaction.transaction_id[:10]}...")
-                return False
+        if verify_signatures and not verify_batch(signatures, data_to_sign):
+            for i, (pub_key_hex, sig_hex) in enumerate(signatures):
+                if not verify(pub_key_hex, data_to_sign, sig_hex):
+                    print(f"Error: Invalid signature for input {i} in transaction {transaction.transaction_id[:10]}...")
+                    break
+            return False
 
         # TODO: Add more checks like positive output amounts, non-negative fee etc.
 
@@ -68,16 +124,32 @@ class Mempool:
 
 
     def get_pending_transactions(self, limit: int = 50) -> List[Transaction]:
-        """Gets a list of pending transactions, up to a limit."""
-        # TODO: Implement fee prioritization
-        return list(self.pending_transactions.values())[:limit]
-
-    def remove_transactions(self, transaction_ids: List[str]):
-        """Removes transactions by ID, typically after they are mined."""
-        removed_count = 0
-        for tx_id in transaction_ids:
-            if self.pending_transactions.pop(tx_id, None):
-                removed_count += 1
+        """Gets up to `limit` pending transactions, highest fee first."""
+        with self._lock:
+            top_entries = heapq.nlargest(limit, self._fee_entries.values())
+            return [self.pending_transactions[entry[2]] for entry in top_entries]
+
+    def remove_transactions(self, transaction_ids: List[str], mined: bool = True):
+        """
+        Removes transactions by ID, typically after they are mined.
+        mined=False evicts them without blocking re-admission (e.g. a bad signature; the id
+        doesn't cover signatures, so a correctly signed copy may still arrive).
+        """
+        with self._lock:
+            removed_count = 0
+            for tx_id in transaction_ids:
+                if self.pending_transactions.pop(tx_id, None):
+                    self._fee_entries.pop(tx_id, None)
+                    removed_count += 1
+                if mined:
+                    self._recently_mined.add(tx_id)
+            if len(self._recently_mined) > self._recently_mined_cap:
+                self._recently_mined_prev = self._recently_mined
+                self._recently_mined = set()
+            # Compact the eviction heap once stale entries dominate it
+            if len(self._eviction_heap) > 2 * len(self._fee_entries) + 16:
+                self._eviction_heap = list(self._fee_entries.values())
+                heapq.heapify(self._eviction_heap)
         if removed_count > 0:
             print(f"Removed {removed_count} txs from mempool. {len(self.pending_transactions)} remaining.")
 
@@ -1,22 +1,40 @@
 import time
 import json
+from dataclasses import dataclass
 from typing import List, Optional, TYPE_CHECKING
 
-from .utils import calculate_merkle_root, public_key_to_address, verify # Relative imports
+from .utils import calculate_merkle_root, public_key_to_address, verify, COIN # Relative imports
 from .transaction import Transaction, TransactionInput, TransactionOutput, COINBASE_TX_ID, COINBASE_OUTPUT_INDEX
 from .block import Block
 from .consensus import Consensus
+from .utxo import UTXOOverlay
 
 if TYPE_CHECKING:
     from .mempool import Mempool
     from .utxo import UTXOSet
     from .chain import Chain
 
-BLOCK_REWARD = 50.0 # Example reward
+BLOCK_REWARD = 50 * COIN # Example reward, in satoshis
+MAX_BLOCK_TRANSACTIONS = 50 # Non-coinbase transactions considered per block
+MAX_BLOCK_SIZE_BYTES = 1_000_000 # Serialized size budget for a block's transactions
+PREVALIDATION_DEADLINE = 2.0 # Seconds spent validating candidates before starting PoW
+MAX_SIZE_SKIPS = 8 # Candidates too large for the remaining space passed over before the block counts as full
 
-def mine_new_block(mempool: 'Mempool', utxo_set: 'UTXOSet', chain: 'Chain', miner_address: str, consensus: Consensus) -> Optional[Block]:
+@dataclass(frozen=True)
+class BlockTemplate:
+    """Everything needed to mine the next block except the timestamp and nonce."""
+    index: int
+    previous_hash: str
+    transactions: List[Transaction] # Coinbase first
+    merkle_root: str
+
+def build_block_template(mempool: 'Mempool', utxo_set: 'UTXOSet', chain: 'Chain', miner_address: str,
+                         verify_signatures: bool = True) -> Optional[BlockTemplate]:
     """
-    Mines a new block including transactions from the mempool and a coinbase reward.
+    Selects and validates mempool transactions for the next block and adds the coinbase.
+    utxo_set is only read (through an overlay), so callers may pass the live set while holding its lock.
+    verify_signatures=False skips the signature checks; the caller must then verify the
+    mined block's signatures before applying it (Node._apply_block does).
     """
     last_block = chain.get_last_block()
     if not last_block:
@@ -27,29 +45,46 @@ def mine_new_block(mempool: 'Mempool', utxo_set: 'UTXOSet', chain: 'Chain', mine
     next_index = last_block.index + 1
 
     valid_txs_for_block: List[Transaction] = []
-    total_fees = 0.0
-    temp_utxo_set = utxo_set.get_copy() # Validate against a temporary copy
-    pending_txs = mempool.get_pending_transactions()
+    total_fees = 0
+    temp_utxo_set = UTXOOverlay(utxo_set) # Validate against an overlay, leaving utxo_set untouched
+    pending_txs = mempool.get_pending_transactions(limit=MAX_BLOCK_TRANSACTIONS) # Highest fee first
+    block_size = 0
+    deadline = time.time() + PREVALIDATION_DEADLINE
+    skipped_signatures = None if verify_signatures else [] # Deferred and never checked
+    size_skips = 0
 
     # print(f"Miner considering {len(pending_txs)} txs for block {next_index}.")
 
     for tx in pending_txs:
+        # Candidates arrive best-fee-first, so once the time budget is spent the
+        # remaining (cheaper) ones need not be validated at all.
+        if time.time() > deadline:
+            break
+        tx_size = tx.size_bytes()
+        if block_size + tx_size > MAX_BLOCK_SIZE_BYTES:
+            # A smaller, cheaper transaction may still fit; give up only after a few misses
+            size_skips += 1
+            if size_skips > MAX_SIZE_SKIPS:
+                break
+            continue
         # Miner performs validation before including
-        validation_result, tx_fee = chain.validate_transaction(tx, temp_utxo_set, check_not_in_set=False) # Expect inputs exist in temp set
+        validation_result, tx_fee = chain.validate_transaction(tx, temp_utxo_set, check_not_in_set=False, # Expect inputs exist in temp set
+                                                               deferred_signatures=skipped_signatures)
         if validation_result:
             valid_txs_for_block.append(tx)
             total_fees += tx_fee
+            block_size += tx_size
             # Update the temporary UTXO set for subsequent validation *within this block*
             for inp in tx.inputs:
                  temp_utxo_set.remove_utxo(inp.transaction_id, inp.output_index)
             for i, out in enumerate(tx.outputs):
                  temp_utxo_set.add_utxo(tx.transaction_id, i, out)
-            # print(f"  Miner included tx {tx.transaction_id[:10]} fee {tx_fee:.8f}")
+            # print(f"  Miner included tx {tx.transaction_id[:10]} fee {tx_fee}")
         # else:
             # print(f"  Miner rejected tx {tx.transaction_id[:10]} during pre-validation.")
 
     # Create Coinbase
-    coinbase_output = TransactionOutput(amount=round(BLOCK_REWARD + total_fees, 8), lock_script=miner_address)
+    coinbase_output = TransactionOutput(amount=BLOCK_REWARD + total_fees, lock_script=miner_address)
     coinbase_input = TransactionInput(
         transaction_id=COINBASE_TX_ID,
         output_index=COINBASE_OUTPUT_INDEX,
@@ -59,21 +94,32 @@ def mine_new_block(mempool: 'Mempool', utxo_set: 'UTXOSet', chain: 'Chain', mine
 
     all_txs_for_block = [coinbase_tx] + valid_txs_for_block
     tx_ids = [tx.transaction_id for tx in all_txs_for_block]
-    merkle_root = calculate_merkle_root(tx_ids)
+    return BlockTemplate(next_index, previous_hash, all_txs_for_block, calculate_merkle_root(tx_ids))
 
+def mine_template(template: BlockTemplate, consensus: Consensus) -> Block:
+    """Runs proof of work over a template and returns the finished block."""
     timestamp = time.time()
-    # print(f"Miner starting PoW for block {next_index}...")
-    nonce = consensus.prove(next_index, timestamp, previous_hash, merkle_root)
+    # print(f"Miner starting PoW for block {template.index}...")
+    nonce = consensus.prove(template.index, timestamp, template.previous_hash, template.merkle_root)
     # print(f"Miner found nonce: {nonce}")
 
     new_block = Block(
-        index=next_index,
-        transactions=all_txs_for_block,
+        index=template.index,
+        transactions=list(template.transactions), # Templates may be mined more than once
         timestamp=timestamp,
-        previous_hash=previous_hash,
-        merkle_root=merkle_root,
+        previous_hash=template.previous_hash,
+        merkle_root=template.merkle_root,
         nonce=nonce
     )
     # Hash calculated in __post_init__
 
     return new_block
+
+def mine_new_block(mempool: 'Mempool', utxo_set: 'UTXOSet', chain: 'Chain', miner_address: str, consensus: Consensus) -> Optional[Block]:
+    """
+    Mines a new block including transactions from the mempool and a coinbase reward.
+    """
+    template = build_block_template(mempool, utxo_set, chain, miner_address)
+    if template is None:
+        return None
+    return mine_template(template, consensus)
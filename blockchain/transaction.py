@@ -1,16 +1,12 @@
 # blockchain/transaction.py
 
-import hashlib
-import json
-from typing import List, Dict, Any, TYPE_CHECKING # Added TYPE_CHECKING
+import struct
+import sys
+import orjson
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
 
-# Import utils if needed elsewhere, but TXID calculation is self-contained now
-# from .utils import ...
-
-# Added TYPE_CHECKING guard for TransactionInput import if needed elsewhere
-# (Not strictly necessary here as it's defined in the same file, but good practice)
-if TYPE_CHECKING:
-     from .transaction import TransactionInput # Type hint for class defined later
+from .utils import sha256_hex
 
 # --- Constants ---
 # Special ID for coinbase transaction inputs (representing no previous output)
@@ -18,24 +14,71 @@ COINBASE_TX_ID = "0" * 64
 # Special index to indicate a coinbase input (standard practice)
 COINBASE_OUTPUT_INDEX = -1
 
+# Fixed-layout pieces of the canonical transaction encoding (see _serialize_tx_for_hash)
+_COUNT_STRUCT = struct.Struct('<I')
+_INDEX_STRUCT = struct.Struct('<i')
+_AMOUNT_STRUCT = struct.Struct('<q')
+_LENGTH_STRUCT = struct.Struct('<H')
+
+def _serialize_tx_for_hash(tx_inputs: List['TransactionInput'], tx_outputs: List['TransactionOutput'],
+                           include_unlock_scripts: bool = False) -> bytes:
+    """
+    Canonical binary encoding of a transaction used for the TXID and as the signed message.
+    Layout: input count, then per input the 32-byte referenced txid and the output index
+    (plus the length-prefixed unlock script JSON if requested), then output count and per
+    output the amount and the length-prefixed lock script. Raises ValueError for any
+    field that can't be encoded: a referenced txid that is not a 32-byte hex digest, a
+    lock script that is too long, or a field of the wrong type (e.g. from a peer's JSON).
+    """
+    try:
+        buf = bytearray(_COUNT_STRUCT.pack(len(tx_inputs)))
+        for inp in tx_inputs:
+            prev_tx_id = bytes.fromhex(inp.transaction_id)
+            if len(prev_tx_id) != 32:
+                 raise ValueError(f"Input transaction id must be 32 bytes, got {len(prev_tx_id)}")
+            buf += prev_tx_id
+            buf += _INDEX_STRUCT.pack(inp.output_index)
+            if include_unlock_scripts:
+                 script = orjson.dumps(inp.unlock_script, option=orjson.OPT_SORT_KEYS)
+                 buf += _LENGTH_STRUCT.pack(len(script))
+                 buf += script
+        buf += _COUNT_STRUCT.pack(len(tx_outputs))
+        for out in tx_outputs:
+            lock_script = out.lock_script.encode('utf-8')
+            buf += _AMOUNT_STRUCT.pack(out.amount)
+            buf += _LENGTH_STRUCT.pack(len(lock_script))
+            buf += lock_script
+        return bytes(buf)
+    except (TypeError, AttributeError, struct.error) as e: # Wrong field type or length prefix overflow
+        raise ValueError(f"Transaction field cannot be encoded: {e}") from e
+
+def _intern_id(tx_id: Any) -> Any:
+    """
+    Interns a hex transaction id so UTXO keys and the inputs that later spend them share
+    one string object: dict probes then match on identity, and each id is stored once.
+    """
+    return sys.intern(tx_id) if type(tx_id) is str else tx_id
+
 # --- Transaction Input Class ---
+@dataclass(frozen=True, slots=True)
 class TransactionInput:
-    """Represents a reference to an output from a previous transaction."""
-    def __init__(self, transaction_id: str, output_index: int, unlock_script: Dict[str, str]):
-        """
-        Args:
-            transaction_id: The ID (hash) of the transaction containing the UTXO being spent.
-                            Use COINBASE_TX_ID for coinbase inputs.
-            output_index: The index (0-based) of the specific output in the referenced transaction.
-                            Use COINBASE_OUTPUT_INDEX for coinbase inputs.
-            unlock_script: Data required to unlock the referenced output.
-                           For standard P2PKH (Pay-to-Public-Key-Hash) style, this typically
-                           contains {'signature': hex_signature, 'public_key': hex_public_key}.
-                           For coinbase transactions, this can contain arbitrary data (miner tag, block height).
-        """
-        self.transaction_id = transaction_id
-        self.output_index = output_index
-        self.unlock_script = unlock_script # e.g., {'signature': '...', 'public_key': '...'} or {'data': '...'}
+    """
+    Represents a reference to an output from a previous transaction.
+    Immutable, so UTXO/transaction containers can be copied shallowly.
+
+    Attributes:
+        transaction_id: The ID (hash) of the transaction containing the UTXO being spent.
+                        Use COINBASE_TX_ID for coinbase inputs.
+        output_index: The index (0-based) of the specific output in the referenced transaction.
+                        Use COINBASE_OUTPUT_INDEX for coinbase inputs.
+        unlock_script: Data required to unlock the referenced output.
+                       For standard P2PKH (Pay-to-Public-Key-Hash) style, this typically
+                       contains {'signature': hex_signature, 'public_key': hex_public_key}.
+                       For coinbase transactions, this can contain arbitrary data (miner tag, block height).
+    """
+    transaction_id: str
+    output_index: int
+    unlock_script: Dict[str, str] # e.g., {'signature': '...', 'public_key': '...'} or {'data': '...'}
 
     def to_dict(self) -> Dict[str, Any]:
         """Serializes the input to a dictionary."""
@@ -55,26 +98,32 @@ class TransactionInput:
              print(f"Warning: Invalid unlock_script format in from_dict for input referencing {data.get('transaction_id')}, using empty dict.")
              unlock_script = {}
         return cls(
-            data['transaction_id'],
+            _intern_id(data['transaction_id']),
             data['output_index'],
             unlock_script
         )
 
 # --- Transaction Output Class ---
+@dataclass(frozen=True, slots=True)
 class TransactionOutput:
-    """Represents an amount of coins locked to a specific condition (address)."""
-    def __init__(self, amount: float, lock_script: str):
-        """
-        Args:
-            amount: The value of coins in this output (e.g., Satoshis or fractional coins).
-            lock_script: The condition required to spend this output.
-                         For simple P2PKH style, this is the recipient's address.
-        """
+    """
+    Represents an amount of coins locked to a specific condition (address).
+    Immutable, so UTXO sets can share output objects between copies.
+
+    Attributes:
+        amount: The value of this output in satoshis (integer, 1 coin = utils.COIN satoshis).
+        lock_script: The condition required to spend this output.
+                     For simple P2PKH style, this is the recipient's address.
+    """
+    amount: int
+    lock_script: str # Recipient Address (in simple model)
+
+    def __post_init__(self):
         # Add basic validation
-        if amount < 0:
+        if type(self.amount) is not int: # Fixed-point only; floats (and bools) are rejected
+             raise ValueError(f"Transaction output amount must be an integer number of satoshis, got {self.amount!r}")
+        if self.amount < 0:
              raise ValueError("Transaction output amount cannot be negative")
-        self.amount = amount
-        self.lock_script = lock_script # Recipient Address (in simple model)
 
     def to_dict(self) -> Dict[str, Any]:
         """Serializes the output to a dictionary."""
@@ -86,14 +135,18 @@ class TransactionOutput:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'TransactionOutput':
         """Deserializes an output from a dictionary."""
+        # Intern the address: a loaded chain/UTXO set otherwise holds one copy per output
+        lock_script = data['lock_script']
         return cls(
             data['amount'],
-            data['lock_script']
+            sys.intern(lock_script) if isinstance(lock_script, str) else lock_script
         )
 
 # --- Transaction Class ---
 class Transaction:
     """Represents a transfer of value, consisting of inputs and outputs."""
+    __slots__ = ('inputs', 'outputs', 'transaction_id', '_data_to_sign', '_size_bytes', '_dict_cache', '_is_coinbase')
+
     def __init__(self, tx_inputs: List[TransactionInput], tx_outputs: List[TransactionOutput], tx_id: str = None):
         """
         Initializes a transaction.
@@ -111,8 +164,19 @@ class Transaction:
 
         self.inputs = tx_inputs
         self.outputs = tx_outputs
-        # Calculate or use provided tx_id *after* inputs/outputs are assigned
-        self.transaction_id = tx_id if tx_id else self._calculate_transaction_id(self.inputs, self.outputs)
+        self._data_to_sign: Optional[bytes] = None # Memoized by get_data_to_sign()
+        self._size_bytes: Optional[int] = None # Memoized by size_bytes()
+        self._dict_cache: Optional[Dict[str, Any]] = None # Memoized by to_dict()
+        self._is_coinbase: Optional[bool] = None # Memoized by is_coinbase()
+        # Calculate or use provided tx_id *after* inputs/outputs are assigned.
+        # Computed once here; every later access is a plain attribute read.
+        if tx_id:
+            self.transaction_id = tx_id
+        elif self.is_coinbase():
+            self.transaction_id = sys.intern(self._calculate_transaction_id(self.inputs, self.outputs))
+        else:
+            # A regular TXID is the hash of the signed message, so encode it only once
+            self.transaction_id = sys.intern(sha256_hex(self.get_data_to_sign()))
 
     @staticmethod
     def _is_coinbase_data(tx_inputs: List[TransactionInput]) -> bool:
@@ -133,57 +197,57 @@ class Transaction:
         Uses different data for coinbase vs regular transactions to ensure uniqueness for coinbase.
         This is a static method to avoid dependency on 'self' during initialization.
         """
-        if Transaction._is_coinbase_data(tx_inputs):
-            # Coinbase TXID calculation: Include full input data (with unique unlock script)
-            # This ensures each coinbase tx has a unique ID based on block-specific data within its script
-            tx_data = {
-                "inputs": [inp.to_dict() for inp in tx_inputs], # Includes unlock_script
-                "outputs": [out.to_dict() for out in tx_outputs],
-            }
-        else:
-            # Regular TXID calculation: Hash only input *references* and outputs.
-            # Signatures (in unlock_script) are NOT part of the TXID calculation for regular transactions.
-            tx_data = {
-                "inputs": [{"transaction_id": inp.transaction_id, "output_index": inp.output_index} for inp in tx_inputs],
-                "outputs": [out.to_dict() for out in tx_outputs],
-            }
-
-        # Use compact, sorted JSON for a deterministic byte representation before hashing
-        tx_string = json.dumps(tx_data, sort_keys=True, separators=(',', ':')).encode('utf-8')
-        return hashlib.sha256(tx_string).hexdigest()
+        # Coinbase TXIDs include the unlock script (block-specific data) so each is unique;
+        # signatures are NOT part of the TXID for regular transactions.
+        is_coinbase = Transaction._is_coinbase_data(tx_inputs)
+        return sha256_hex(_serialize_tx_for_hash(tx_inputs, tx_outputs, include_unlock_scripts=is_coinbase))
 
     # --- Instance Methods ---
 
     def is_coinbase(self) -> bool:
         """Checks if this transaction instance is a coinbase transaction."""
-        # This method can now safely use self.inputs after initialization is complete
-        return self._is_coinbase_data(self.inputs)
+        if self._is_coinbase is None:
+             self._is_coinbase = self._is_coinbase_data(self.inputs)
+        return self._is_coinbase
 
-    def get_data_to_sign(self) -> str:
+    def get_data_to_sign(self) -> bytes:
          """
-         Creates a deterministic string representation of the transaction's core components
-         (input references and all outputs) used for signing the inputs.
-         Excludes unlock scripts (signatures).
+         Returns the canonical encoding of the transaction's input references and outputs,
+         used as the message signed by every input. Excludes unlock scripts (signatures).
+         The result is cached, so inputs/outputs must not be mutated afterwards.
          """
-         tx_data = {
-            "inputs": [{"transaction_id": inp.transaction_id, "output_index": inp.output_index} for inp in self.inputs],
-            "outputs": [out.to_dict() for out in self.outputs],
-         }
-         # Use compact, sorted JSON string as the message to be signed
-         return json.dumps(tx_data, sort_keys=True, separators=(',',':'))
+         if self._data_to_sign is None:
+              self._data_to_sign = _serialize_tx_for_hash(self.inputs, self.outputs)
+         return self._data_to_sign
 
-    def to_dict(self) -> Dict[str, Any]:
-        """Serializes the entire transaction to a dictionary."""
-        # Ensure transaction_id exists (should always be true after __init__)
-        if not hasattr(self, 'transaction_id') or not self.transaction_id:
-             print("Warning: Recalculating tx_id in to_dict. This shouldn't normally happen.")
-             self.transaction_id = self._calculate_transaction_id(self.inputs, self.outputs)
+    def with_signed_inputs(self, signed_inputs: List[TransactionInput]) -> 'Transaction':
+        """
+        Returns a copy of this transaction with its inputs replaced by signed ones.
+        Unlock scripts are not part of a regular TXID or signed message, so both carry over.
+        """
+        signed_tx = Transaction(signed_inputs, self.outputs, tx_id=self.transaction_id)
+        signed_tx._data_to_sign = self._data_to_sign
+        return signed_tx
 
-        return {
-            "transaction_id": self.transaction_id,
-            "inputs": [inp.to_dict() for inp in self.inputs],
-            "outputs": [out.to_dict() for out in self.outputs],
-        }
+    def size_bytes(self) -> int:
+        """Returns the size of the transaction's compact JSON serialization (cached)."""
+        if self._size_bytes is None:
+             self._size_bytes = len(orjson.dumps(self.to_dict()))
+        return self._size_bytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serializes the entire transaction to a dictionary.
+        The dict is built once and shared between callers; treat it as read-only
+        (copy.deepcopy it before making changes).
+        """
+        if self._dict_cache is None:
+             self._dict_cache = {
+                 "transaction_id": self.transaction_id,
+                 "inputs": [inp.to_dict() for inp in self.inputs],
+                 "outputs": [out.to_dict() for out in self.outputs],
+             }
+        return self._dict_cache
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Transaction':
@@ -203,7 +267,7 @@ class Transaction:
             # if calculated_id != tx_id_from_data:
             #      print(f"Warning: TXID mismatch in from_dict for {tx_id_from_data[:10]}. Loaded={tx_id_from_data}, Calculated={calculated_id}")
 
-            return cls(inputs, outputs, tx_id=tx_id_from_data)
+            return cls(inputs, outputs, tx_id=_intern_id(tx_id_from_data))
         except KeyError as e:
              raise ValueError(f"Missing required field in transaction data: {e}")
         except Exception as e:
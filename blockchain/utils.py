@@ -1,78 +1,185 @@
+import functools
 import hashlib
-import json
+import struct
 import time
 from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError # Using SECP256k1 like Bitcoin
-from typing import List, Any, Tuple
+try: # libsecp256k1 bindings; the pure-Python ecdsa package above is the fallback
+    import coincurve
+    from coincurve.ecdsa import cdata_to_der, der_to_cdata, deserialize_compact, serialize_compact, signature_normalize
+except ImportError:
+    coincurve = None
+from typing import List, Any, Tuple, Dict, Union
+
+# --- Amounts ---
+# Amounts are integer satoshis everywhere inside the node; coins only appear at the API edge.
+COIN = 100_000_000
+
+def coins_to_satoshis(coins: Any) -> int:
+    """Converts a coin amount (number or numeric string) to integer satoshis."""
+    return int(round(float(coins) * COIN))
+
+def satoshis_to_coins(satoshis: int) -> float:
+    """Converts integer satoshis to a coin amount for display."""
+    return satoshis / COIN
 
 # --- Hashing ---
+# hashlib's OpenSSL backend already selects SHA-NI / AVX2 SHA-256 code at runtime,
+# so every hot-path hash goes through this one binding instead of a native module.
+# On CPython this is _hashlib.openssl_sha256 itself (no Python wrapper in between),
+# and binding it once at module level also skips the attribute lookup per call.
+_sha256 = hashlib.sha256
+
+def sha256_hex(data: bytes) -> str:
+    """Returns the hex SHA-256 digest of data."""
+    return _sha256(data).hexdigest()
+
+# Fixed binary block header: index, timestamp, previous hash, merkle root, nonce (88 bytes).
+# Everything but the trailing nonce is constant while mining a block.
+HEADER_PREFIX_STRUCT = struct.Struct('<Qd32s32s')
+NONCE_STRUCT = struct.Struct('<Q')
+MAX_NONCE = (1 << 64) - 1
+
+def block_header_prefix(index: int, timestamp: float, previous_hash: str, merkle_root: str) -> bytes:
+    """Returns the nonce-independent leading 80 bytes of a block header."""
+    return HEADER_PREFIX_STRUCT.pack(index, timestamp, bytes.fromhex(previous_hash), bytes.fromhex(merkle_root))
+
 def calculate_block_hash(index: int, timestamp: float, previous_hash: str, merkle_root: str, nonce: int) -> str:
     """Calculates the SHA-256 hash for a block header."""
-    header_data = f"{index}{timestamp}{previous_hash}{merkle_root}{nonce}"
-    return hashlib.sha256(header_data.encode('utf-8')).hexdigest()
-
-def calculate_tx_hash(tx_inputs_refs: List[dict], tx_outputs_data: List[dict]) -> str:
-     """Calculates the transaction ID deterministically."""
-     tx_data = {
-        "inputs": tx_inputs_refs, # Only references matter for txid
-        "outputs": tx_outputs_data,
-     }
-     tx_string = json.dumps(tx_data, sort_keys=True).encode('utf-8')
-     return hashlib.sha256(tx_string).hexdigest()
+    header_data = block_header_prefix(index, timestamp, previous_hash, merkle_root) + NONCE_STRUCT.pack(nonce)
+    return _sha256(header_data).hexdigest()
 
 # --- ECDSA ---
+# Wire formats are the same for both backends: 32-byte private keys, 64-byte raw
+# (x || y) public keys and 64-byte (r || s) signatures, all hex encoded.
 def generate_key_pair() -> Tuple[str, str]:
     """Generates an ECDSA key pair (private, public) hex encoded."""
+    if coincurve is not None:
+        sk = coincurve.PrivateKey()
+        return sk.secret.hex(), sk.public_key.format(compressed=False)[1:].hex()
     sk = SigningKey.generate(curve=SECP256k1)
     vk = sk.verifying_key
     return sk.to_string().hex(), vk.to_string().hex()
 
-def sign(private_key_hex: str, message: str) -> str:
+def _message_bytes(message: Union[str, bytes]) -> bytes:
+    return message.encode('utf-8') if isinstance(message, str) else message
+
+def _load_verifying_key(public_key_hex: str) -> Any:
+    if coincurve is not None:
+        return coincurve.PublicKey(b'\x04' + bytes.fromhex(public_key_hex))
+    return VerifyingKey.from_string(bytes.fromhex(public_key_hex), curve=SECP256k1)
+
+def _verify_digest(vk: Any, signature_hex: str, message_hash: bytes) -> bool:
+    if coincurve is not None:
+        # libsecp256k1 only accepts low-S signatures; normalize so high-S ones
+        # produced by the ecdsa backend still verify
+        _, signature = signature_normalize(deserialize_compact(bytes.fromhex(signature_hex)))
+        return vk.verify(cdata_to_der(signature), message_hash, hasher=None)
+    return vk.verify_digest(bytes.fromhex(signature_hex), message_hash)
+
+def sign(private_key_hex: str, message: Union[str, bytes]) -> str:
     """Signs a message using a private key."""
-    sk = SigningKey.from_string(bytes.fromhex(private_key_hex), curve=SECP256k1)
     # Hash the message before signing - common practice
-    message_hash = hashlib.sha256(message.encode('utf-8')).digest()
+    message_hash = _sha256(_message_bytes(message)).digest()
+    if coincurve is not None:
+        signature_der = coincurve.PrivateKey(bytes.fromhex(private_key_hex)).sign(message_hash, hasher=None)
+        return serialize_compact(der_to_cdata(signature_der)).hex()
+    sk = SigningKey.from_string(bytes.fromhex(private_key_hex), curve=SECP256k1)
     signature = sk.sign_digest(message_hash) # Sign the hash
     return signature.hex()
 
-def verify(public_key_hex: str, message: str, signature_hex: str) -> bool:
+def verify(public_key_hex: str, message: Union[str, bytes], signature_hex: str) -> bool:
     """Verifies a signature using a public key."""
     try:
-        vk = VerifyingKey.from_string(bytes.fromhex(public_key_hex), curve=SECP256k1)
-        message_hash = hashlib.sha256(message.encode('utf-8')).digest()
-        return vk.verify_digest(bytes.fromhex(signature_hex), message_hash) # Verify against the hash
+        vk = _load_verifying_key(public_key_hex)
+        message_hash = _sha256(_message_bytes(message)).digest()
+        return _verify_digest(vk, signature_hex, message_hash) # Verify against the hash
     except BadSignatureError:
         return False
     except Exception as e:
         # print(f"Error during verification: {e}") # Debug only
         return False
 
+def verify_batch(signatures: List[Tuple[str, str]], message: Union[str, bytes]) -> bool:
+    """
+    Verifies several (public_key_hex, signature_hex) pairs over the same message.
+    The message is hashed once and each distinct public key is parsed once.
+    """
+    try:
+        message_hash = _sha256(_message_bytes(message)).digest()
+        verifying_keys: Dict[str, Any] = {}
+        for public_key_hex, signature_hex in signatures:
+            vk = verifying_keys.get(public_key_hex)
+            if vk is None:
+                vk = _load_verifying_key(public_key_hex)
+                verifying_keys[public_key_hex] = vk
+            if not _verify_digest(vk, signature_hex, message_hash):
+                return False
+        return True
+    except BadSignatureError:
+        return False
+    except Exception:
+        return False
+
+def verify_many(items: List[Tuple[str, Union[str, bytes], str]]) -> List[bool]:
+    """
+    Verifies (public_key_hex, message, signature_hex) triples, e.g. every input of a block.
+    Each distinct message is hashed once and each distinct public key parsed once.
+    Returns one result per item.
+    """
+    message_hashes: Dict[bytes, bytes] = {}
+    verifying_keys: Dict[str, Any] = {}
+    results: List[bool] = []
+    for public_key_hex, message, signature_hex in items:
+        try:
+            message = _message_bytes(message)
+            message_hash = message_hashes.get(message)
+            if message_hash is None:
+                message_hash = message_hashes[message] = _sha256(message).digest()
+            vk = verifying_keys.get(public_key_hex)
+            if vk is None:
+                vk = verifying_keys[public_key_hex] = _load_verifying_key(public_key_hex)
+            results.append(bool(_verify_digest(vk, signature_hex, message_hash)))
+        except Exception: # BadSignatureError or malformed hex/key
+            results.append(False)
+    return results
+
 # --- Address ---
 def public_key_to_address(public_key_hex: str) -> str:
     """Generates a simple address by hashing the public key."""
     # TODO: Implement proper address encoding (e.g., Base58Check)
     public_key_bytes = bytes.fromhex(public_key_hex)
-    return hashlib.sha256(public_key_bytes).hexdigest()
+    return _sha256(public_key_bytes).hexdigest()
 
 # --- Merkle Tree ---
+MERKLE_CACHE_SIZE = 256 # Recent (tx id list -> root) results kept by calculate_merkle_root
+
 def calculate_merkle_root(transaction_ids: List[str]) -> str:
     """Calculates the Merkle root for a list of transaction IDs."""
+    return _merkle_root_of(tuple(transaction_ids))
+
+# A block's root is computed when it is mined/built and again when it is validated
+# (and once more per duplicate relay), so keep recent results keyed by the id list.
+@functools.lru_cache(maxsize=MERKLE_CACHE_SIZE)
+def _merkle_root_of(transaction_ids: Tuple[str, ...]) -> str:
     if not transaction_ids:
-        return hashlib.sha256(b"").hexdigest() # Hash of empty data
+        return _sha256(b"").hexdigest() # Hash of empty data
+
+    if len(transaction_ids) == 1:
+         return transaction_ids[0] # A lone leaf is its own root
 
-    # Make copies to avoid modifying original list if needed elsewhere
-    current_level = list(transaction_ids)
+    # Reduce over raw 32-byte digests: one 64-byte message (a single SHA-256 block
+    # plus padding) per pair, and hex only at the top for API compatibility
+    current_level = [bytes.fromhex(tx_id) for tx_id in transaction_ids]
+    sha256 = _sha256
 
     while len(current_level) > 1:
          # Ensure even number of leaves for pairing
          if len(current_level) % 2 != 0:
               current_level.append(current_level[-1])
 
-         next_level = []
-         for i in range(0, len(current_level), 2):
-              # Concatenate hashes as hex strings before hashing again
-              combined_data = (current_level[i] + current_level[i+1]).encode('utf-8')
-              combined_hash = hashlib.sha256(combined_data).hexdigest()
-              next_level.append(combined_hash)
-         current_level = next_level # Move to the next level up the tree
+         # zip() over one shared iterator yields consecutive pairs without the
+         # two slice copies per level
+         pairs = iter(current_level)
+         current_level = [sha256(left + right).digest() for left, right in zip(pairs, pairs)]
 
-    return current_level[0] # The final root hash.
+    return current_level[0].hex() # The final root hash.
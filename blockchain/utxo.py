@@ -1,5 +1,7 @@
-from typing import Dict, Tuple, Optional, List, TYPE_CHECKING
-import copy
+from collections import defaultdict
+from typing import Dict, Tuple, Optional, List, Set, Iterator, TYPE_CHECKING
+
+from sortedcontainers import SortedList
 
 # Assuming transaction.py is accessible
 from .transaction import TransactionOutput, TransactionInput, Transaction, COINBASE_TX_ID, COINBASE_OUTPUT_INDEX
@@ -12,31 +14,70 @@ class UTXOSet:
     def __init__(self):
         # Stores UTXOKey -> TransactionOutput
         self.utxos: Dict[UTXOKey, TransactionOutput] = {}
+        # Secondary indices kept in step with self.utxos (see _index_output/_unindex_output)
+        # address -> (amount, key) pairs in ascending amount order
+        self._by_address: Dict[str, SortedList] = defaultdict(SortedList)
+        self._balance: Dict[str, int] = defaultdict(int) # Satoshis
+
+    def _index_output(self, key: UTXOKey, output: TransactionOutput):
+        self._by_address[output.lock_script].add((output.amount, key))
+        self._balance[output.lock_script] += output.amount
+
+    def _unindex_output(self, key: UTXOKey, output: TransactionOutput):
+        address = output.lock_script
+        keys = self._by_address.get(address)
+        if keys is None:
+            return
+        keys.discard((output.amount, key))
+        if keys:
+            self._balance[address] -= output.amount
+        else: # Drop empty entries
+            del self._by_address[address]
+            self._balance.pop(address, None)
+
+    def _rebuild_index(self):
+        self._by_address.clear()
+        self._balance.clear()
+        for key, output in self.utxos.items():
+            self._index_output(key, output)
 
     def find_utxos_for_address(self, address: str) -> Dict[UTXOKey, TransactionOutput]:
         """Finds all UTXOs belonging to a specific address."""
-        found = {}
-        for utxo_key, utxo_output in self.utxos.items():
-            if utxo_output.lock_script == address:
-                found[utxo_key] = utxo_output
-        return found
+        utxos = self.utxos
+        return {key: utxos[key] for _, key in self._by_address.get(address, ())}
+
+    def iter_utxos_by_amount(self, address: str, largest_first: bool = False) -> Iterator[Tuple[UTXOKey, TransactionOutput]]:
+        """Yields an address's UTXOs ordered by amount, without sorting per call."""
+        entries = self._by_address.get(address, ())
+        utxos = self.utxos
+        for _, key in (reversed(entries) if largest_first else entries):
+            yield key, utxos[key]
 
-    def get_balance(self, address: str) -> float:
-        """Calculates the total balance for a given address."""
-        utxos = self.find_utxos_for_address(address)
-        return sum(output.amount for output in utxos.values())
+    def get_balance(self, address: str) -> int:
+        """Returns the total balance for a given address, in satoshis."""
+        return self._balance.get(address, 0)
+
+    def get_all_balances(self) -> Dict[str, int]:
+        """Returns a snapshot of every address with a non-zero UTXO count -> balance (satoshis)."""
+        return dict(self._balance)
 
     def add_utxo(self, tx_id: str, index: int, output: TransactionOutput):
         """Adds a new UTXO to the set."""
         key = (tx_id, index)
-        if key in self.utxos:
+        previous = self.utxos.get(key)
+        if previous is not None:
             print(f"Warning: UTXO {key} already exists in the set. Overwriting.")
+            self._unindex_output(key, previous)
         self.utxos[key] = output
+        self._index_output(key, output)
 
     def remove_utxo(self, tx_id: str, index: int) -> Optional[TransactionOutput]:
         """Removes a UTXO from the set when it's spent."""
         key = (tx_id, index)
-        return self.utxos.pop(key, None) # Return the removed UTXO or None if not found
+        removed = self.utxos.pop(key, None)
+        if removed is not None:
+            self._unindex_output(key, removed)
+        return removed # Return the removed UTXO or None if not found
 
     def get_utxo(self, tx_id: str, index: int) -> Optional[TransactionOutput]:
          """Gets a specific UTXO without removing it."""
@@ -62,19 +103,93 @@ class UTXOSet:
         # print(f"UTXO set size after Block {block.index}: {len(self.utxos)}")
 
 
+    def apply_overlay(self, overlay: 'UTXOOverlay'):
+        """Commits the changes recorded in an overlay of this set using bulk dict operations."""
+        utxos = self.utxos
+        for key in overlay.removed:
+            self._unindex_output(key, utxos.pop(key))
+        for key, output in overlay.added.items():
+            previous = utxos.get(key)
+            if previous is not None:
+                self._unindex_output(key, previous)
+            self._index_output(key, output)
+        utxos.update(overlay.added)
+
+
     def rebuild(self, chain: 'Chain'): # Needs Chain type hint
         """Rebuilds the UTXO set from the genesis block."""
         print("Rebuilding UTXO set from chain...")
-        self.utxos.clear()
+        # Replay on the bare dict and derive the address indices once at the end, so
+        # outputs created and spent during the replay never touch the sorted index
+        utxos = self.utxos
+        utxos.clear()
         for block in chain.blocks:
-            self.update_from_block(block)
+            for tx in block.transactions:
+                if not tx.is_coinbase(): # Coinbase inputs don't reference real UTXOs
+                    for inp in tx.inputs:
+                        utxos.pop((inp.transaction_id, inp.output_index), None)
+                tx_id = tx.transaction_id
+                utxos.update({(tx_id, i): out for i, out in enumerate(tx.outputs)}) # Bulk insert per tx
+        self._rebuild_index()
         print(f"UTXO set rebuilt. Size: {len(self.utxos)}")
 
     def __len__(self) -> int:
          return len(self.utxos)
 
     def get_copy(self) -> 'UTXOSet':
-         """Returns a deep copy of the UTXO set, useful for validation."""
+         """
+         Returns an independent copy of the UTXO set, useful for validation.
+         Keys and TransactionOutput values are immutable, so a shallow copy suffices.
+         """
          new_set = UTXOSet()
-         new_set.utxos = copy.deepcopy(self.utxos) # Ensure outputs are copied too
+         new_set.utxos = dict(self.utxos)
+         # Copy the indices rather than re-deriving them; only the key sets are mutable
+         new_set._by_address = defaultdict(SortedList, {address: keys.copy() for address, keys in self._by_address.items()})
+         new_set._balance = defaultdict(int, self._balance)
          return new_set
+
+
+class UTXOOverlay:
+    """
+    A copy-free view of a UTXOSet that records additions and removals on top of it.
+    Used to validate/assemble a block without touching (or copying) the base set.
+    """
+
+    def __init__(self, base: UTXOSet):
+        self.base = base
+        self.added: Dict[UTXOKey, TransactionOutput] = {}
+        self.removed: Set[UTXOKey] = set() # Keys present in the base set that are spent here
+
+    def get_utxo(self, tx_id: str, index: int) -> Optional[TransactionOutput]:
+        """Gets a UTXO as seen through the overlay."""
+        key = (tx_id, index)
+        if key in self.added:
+            return self.added[key]
+        if key in self.removed:
+            return None
+        return self.base.get_utxo(tx_id, index)
+
+    def add_utxo(self, tx_id: str, index: int, output: TransactionOutput):
+        """Records a new UTXO in the overlay."""
+        self.added[(tx_id, index)] = output
+
+    def remove_utxo(self, tx_id: str, index: int) -> Optional[TransactionOutput]:
+        """Records a UTXO as spent in the overlay."""
+        key = (tx_id, index)
+        removed = self.get_utxo(tx_id, index)
+        if removed is not None:
+            self.added.pop(key, None)
+            if self.base.get_utxo(tx_id, index) is not None:
+                self.removed.add(key)
+        return removed
+
+    def apply_overlay(self, overlay: 'UTXOOverlay'):
+        """
+        Folds a child overlay's changes into this one, so overlays can be stacked as a
+        write-back layer over the base set (e.g. one per batch of blocks). Outputs created
+        and spent before the final flush cancel out here and never touch the base set's indices.
+        """
+        for key in overlay.removed:
+            if self.added.pop(key, None) is None:
+                self.removed.add(key) # Spends an output of the base set
+        self.added.update(overlay.added)
@@ -22,8 +22,8 @@ class Wallet:
     def get_address(self) -> str:
         return self.address
 
-    def create_transaction(self, recipient_address: str, amount: float, fee: float, utxo_set: 'UTXOSet') -> Optional[Transaction]:
-        """Creates a signed transaction if sufficient funds are available."""
+    def create_transaction(self, recipient_address: str, amount: int, fee: int, utxo_set: 'UTXOSet') -> Optional[Transaction]:
+        """Creates a signed transaction if sufficient funds are available. Amounts are in satoshis."""
         if amount <= 0:
             # print("Error: Transaction amount must be positive.")
             return None
@@ -31,20 +31,15 @@ class Wallet:
             # print("Error: Fee cannot be negative.")
             return None
 
-        available_utxos = utxo_set.find_utxos_for_address(self.address)
-        if not available_utxos:
-            # print(f"Error: No funds available for address {self.address}")
-            return None
 
         inputs: list[TransactionInput] = []
         selected_utxo_keys: list[tuple[str, int]] = []
-        total_input_amount = 0.0
+        total_input_amount = 0
         target_amount = amount + fee
 
-        # Sort UTXOs (optional, e.g., by amount) for deterministic selection or efficiency
-        sorted_utxos = sorted(available_utxos.items(), key=lambda item: item[1].amount)
-
-        for utxo_key, utxo_output in sorted_utxos:
+        # Greedy largest-first over the set's amount-ordered index: fewer inputs per tx
+        # means a smaller signed payload and less validation work downstream
+        for utxo_key, utxo_output in utxo_set.iter_utxos_by_amount(self.address, largest_first=True):
             inputs.append(TransactionInput(utxo_key[0], utxo_key[1], {}))
             selected_utxo_keys.append(utxo_key)
             total_input_amount += utxo_output.amount
@@ -52,34 +47,30 @@ class Wallet:
                 break
 
         if total_input_amount < target_amount:
-            # print(f"Error: Insufficient funds. Need {target_amount:.8f}, have {total_input_amount:.8f}")
+            # print(f"Error: Insufficient funds. Need {target_amount}, have {total_input_amount}")
             return None
 
         outputs: list[TransactionOutput] = []
-        # Use round() carefully with floats, consider using Decimal for currency
-        outputs.append(TransactionOutput(round(amount, 8), recipient_address))
+        outputs.append(TransactionOutput(amount, recipient_address))
 
-        change_amount = round(total_input_amount - target_amount, 8)
-        if change_amount > 0.00000001: # Dust threshold
+        change_amount = total_input_amount - target_amount # Exact integer arithmetic
+        if change_amount > 0:
              outputs.append(TransactionOutput(change_amount, self.address))
 
         unsigned_tx = Transaction(inputs, outputs) # Create dummy inputs first
         data_to_sign = unsigned_tx.get_data_to_sign()
 
-        signed_inputs: list[TransactionInput] = []
-        for i, inp_ref in enumerate(unsigned_tx.inputs): # Use the dummy inputs for references
-            signature_hex = utils.sign(self.private_key_hex, data_to_sign)
-            unlock_script = {
-                "signature": signature_hex,
-                "public_key": self.public_key_hex
-            }
-            signed_inputs.append(TransactionInput(
-                inp_ref.transaction_id,
-                inp_ref.output_index,
-                unlock_script
-            ))
+        # Every input is unlocked by the same key over the same message, so one signature serves all
+        unlock_script = {
+            "signature": utils.sign(self.private_key_hex, data_to_sign),
+            "public_key": self.public_key_hex
+        }
+        signed_inputs: list[TransactionInput] = [
+            TransactionInput(inp_ref.transaction_id, inp_ref.output_index, unlock_script)
+            for inp_ref in unsigned_tx.inputs # Use the dummy inputs for references
+        ]
 
-        # Final transaction with signed inputs
-        final_tx = Transaction(signed_inputs, outputs)
+        # Final transaction with signed inputs (reuses the unsigned tx's id and signing data)
+        final_tx = unsigned_tx.with_signed_inputs(signed_inputs)
         # print(f"Created transaction {final_tx.transaction_id[:10]}...")
         return final_tx
\ No newline at end of file
@@ -1,18 +1,24 @@
-import time
 import os
 import argparse
 import sys
 import threading
 import logging
+import queue
+import re
+import signal
+from collections import OrderedDict
 
-from typing import Optional
+from typing import Any, Optional
 
 # Import Flask components
-from flask import Flask, request, jsonify
+import orjson
+from flask import Flask, Response, request, stream_with_context
+from werkzeug.exceptions import HTTPException
 
 # Import necessary blockchain components
 from node import Node # Assuming node.py is at the root level
 from blockchain.consensus import ProofOfWork
+from blockchain.utils import coins_to_satoshis, satoshis_to_coins
 # Wallet class needed for type hinting if used directly, but likely not needed here
 # from blockchain.wallet import Wallet
 
@@ -20,13 +26,73 @@ from blockchain.consensus import ProofOfWork
 DEFAULT_DIFFICULTY = 4
 DEFAULT_BASE_P2P_PORT = 5000 # Base for P2P
 DEFAULT_BASE_API_PORT = 5050 # Base for API
+# Nonce search processes. Kept above 1 so hashing never runs on a node thread and competes
+# with the API/P2P threads for the GIL; the spawn-based pool starts once and is reused for
+# every block. Leaves one core for the node's threads when possible.
+DEFAULT_MINING_WORKERS = max(2, (os.cpu_count() or 2) - 1)
+API_THREADS = 16 # Worker threads serving API requests concurrently
+BALANCES_STREAM_CHUNK = 1000 # Address entries serialized per chunk of the streamed /all-balances body
+MAX_BATCH_SIZE = 100 # Addresses / sub-requests accepted by one /balances or /batch call
+TX_QUEUE_SIZE = 10_000 # Created transactions waiting for mempool admission; /create-transaction answers 503 when full
+TX_STATUS_SIZE = 2 * TX_QUEUE_SIZE # Recent API transaction outcomes kept for /transaction-status
 CHAIN_FILE_PREFIX = "chain_data_node_"
 
+# Addresses are the hex SHA-256 of a public key
+_ADDR_RE = re.compile(r'[0-9a-fA-F]{64}').fullmatch
+
+def _valid_addr(address: Any) -> bool:
+    """True for a 64-character hex address string."""
+    return isinstance(address, str) and _ADDR_RE(address) is not None
+
+def _json(obj: Any, status: int = 200) -> Response:
+    """Serializes obj with orjson into a JSON response (replaces jsonify)."""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def _request_json() -> Any:
+    """Parses the request body with orjson whatever the Content-Type; None if it isn't valid JSON."""
+    try: return orjson.loads(request.get_data(cache=False)) # Body isn't kept on the request afterwards
+    except orjson.JSONDecodeError: return None
+
 # --- Global variable to hold the running node instance ---
 current_node: Optional[Node] = None # Use Optional typing
+node_ready = threading.Event() # Set once current_node is assigned; checked before every API request
+
+# Transactions created via the API are handed to one drainer thread instead of being
+# admitted on the request thread, so a flood backs up here rather than in the mempool lock
+_tx_queue: "queue.Queue" = queue.Queue(maxsize=TX_QUEUE_SIZE)
+
+# Outcome of each queued transaction (pending -> accepted/rejected), oldest first, so a client
+# holding the 202 response can find out whether the mempool took it
+_tx_status: "OrderedDict[str, str]" = OrderedDict()
+_tx_status_lock = threading.Lock()
+
+def _set_tx_status(tx_id: str, status: str):
+    with _tx_status_lock:
+        _tx_status[tx_id] = status
+        _tx_status.move_to_end(tx_id)
+        if len(_tx_status) > TX_STATUS_SIZE:
+            _tx_status.popitem(last=False) # Forget the oldest
+
+def _submit_queued_tx(tx):
+    """Submits one queued API transaction to the mempool, broadcasts it and records the outcome."""
+    try:
+        accepted = current_node.submit_and_broadcast_transaction(tx, signed_locally=True) # Built by the node's own wallet
+    except Exception as e:
+        logging.error("API tx queue: submitting %.10s failed: %s", tx.transaction_id, e, exc_info=True)
+        accepted = False
+    _set_tx_status(tx.transaction_id, "accepted" if accepted else "rejected")
+
+def _drain_tx_queue():
+    """Thread target: submits queued API transactions one at a time."""
+    while True:
+        _submit_queued_tx(_tx_queue.get())
 
 # --- Flask App Setup ---
 flask_app = Flask(__name__)
+# Endpoints serialize with orjson (_json); keep anything that still goes through Flask's
+# JSON provider from sorting keys or \u-escaping non-ASCII as well
+flask_app.json.sort_keys = False
+flask_app.json.ensure_ascii = False
 
 # --- Logging Setup ---
 # Configure root logger
@@ -43,70 +109,131 @@ logging.basicConfig(
 
 # --- API Endpoints ---
 
+@flask_app.before_request
+def require_node():
+    """Rejects every request until the node is initialized."""
+    if not node_ready.is_set():
+        return _json({"error": "Node not initialized"}, 503)
+
 @flask_app.route('/status', methods=['GET'])
 def get_status():
     """Returns the current status of the node."""
-    if not current_node: return jsonify({"error": "Node not initialized"}), 503
-    try: return jsonify(current_node.get_status()), 200
-    except Exception as e: logging.error(f"API /status Error: {e}", exc_info=True); return jsonify({"error": "Internal server error"}), 500
+    try:
+        status = current_node.get_status()
+        status["node_balance"] = satoshis_to_coins(status["node_balance"]) # The API reports coins
+        return _json(status, 200)
+    except Exception as e: logging.error("API /status Error: %s", e, exc_info=True); return _json({"error": "Internal server error"}, 500)
 
 @flask_app.route('/balance/<address>', methods=['GET'])
 def get_address_balance(address: str):
     """Returns the balance for a specific address."""
-    if not current_node: return jsonify({"error": "Node not initialized"}), 503
     try:
         # Basic validation - adjust if addresses have prefixes/checksums later
-        if not address or not isinstance(address, str) or len(address) != 64:
-             return jsonify({"error": "Invalid address format (expected 64 hex chars)"}), 400
+        if not _valid_addr(address):
+             return _json({"error": "Invalid address format (expected 64 hex chars)"}, 400)
         balance = current_node.get_balance(address)
-        return jsonify({"address": address, "balance": balance}), 200
-    except Exception as e: logging.error(f"API /balance/{address} Error: {e}", exc_info=True); return jsonify({"error": "Internal server error"}), 500
+        return _json({"address": address, "balance": satoshis_to_coins(balance)}, 200)
+    except Exception as e: logging.error("API /balance/%s Error: %s", address, e, exc_info=True); return _json({"error": "Internal server error"}, 500)
 
 @flask_app.route('/all-balances', methods=['GET'])
 def get_all_node_balances():
     """Returns all balances known by this node's UTXO set."""
-    if not current_node: return jsonify({"error": "Node not initialized"}), 503
-    try: return jsonify(current_node.get_all_balances()), 200
-    except Exception as e: logging.error(f"API /all-balances Error: {e}", exc_info=True); return jsonify({"error": "Internal server error"}), 500
+    def generate():
+        # Stream the JSON object in chunks instead of building a coin-valued copy of every balance first
+        yield b'{'
+        separator = b''
+        chunk = []
+        for address, balance in current_node.iter_balances():
+            chunk.append(separator + orjson.dumps(address) + b':' + orjson.dumps(satoshis_to_coins(balance)))
+            separator = b','
+            if len(chunk) >= BALANCES_STREAM_CHUNK:
+                yield b''.join(chunk); chunk.clear()
+        chunk.append(b'}')
+        yield b''.join(chunk)
+
+    try: return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+    except Exception as e: logging.error("API /all-balances Error: %s", e, exc_info=True); return _json({"error": "Internal server error"}, 500)
+
+@flask_app.route('/balances', methods=['POST'])
+def get_address_balances():
+    """
+    Returns the balances of several addresses in one call.
+    Expects JSON: {"addresses": ["<address>", ...]}
+    """
+    data = _request_json()
+    addresses = data.get("addresses") if isinstance(data, dict) else None
+    if not isinstance(addresses, list) or len(addresses) > MAX_BATCH_SIZE:
+        return _json({"error": f"Expected JSON {{\"addresses\": [...]}} with at most {MAX_BATCH_SIZE} entries"}, 400)
+    if not all(map(_valid_addr, addresses)):
+        return _json({"error": "Invalid address format (expected 64 hex chars)"}, 400)
+    try:
+        balances = current_node.get_balances(addresses)
+        return _json({address: satoshis_to_coins(balance) for address, balance in balances.items()}, 200)
+    except Exception as e: logging.error("API /balances Error: %s", e, exc_info=True); return _json({"error": "Internal server error"}, 500)
+
+@flask_app.route('/batch', methods=['POST'])
+def api_batch():
+    """
+    Runs several GET endpoints in one HTTP round trip.
+    Expects JSON: {"requests": ["/status", "/balance/<address>", ...]}
+    Returns {"responses": [{"path": ..., "status": ..., "body": ...}, ...]} in request order.
+    """
+    data = _request_json()
+    paths = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(paths, list) or len(paths) > MAX_BATCH_SIZE or not all(isinstance(path, str) for path in paths):
+        return _json({"error": f"Expected JSON {{\"requests\": [\"/path\", ...]}} with at most {MAX_BATCH_SIZE} entries"}, 400)
+
+    url_adapter = flask_app.url_map.bind("")
+    responses = []
+    for path in paths:
+        try:
+            # Dispatch straight to the view function; no extra HTTP/WSGI cycle per sub-request
+            endpoint, view_args = url_adapter.match(path, method='GET')
+            sub_response = flask_app.make_response(flask_app.view_functions[endpoint](**view_args))
+            responses.append({"path": path, "status": sub_response.status_code, "body": sub_response.get_json()})
+        except HTTPException as e: # No such route, or not a GET route
+            responses.append({"path": path, "status": e.code, "body": {"error": e.name}})
+    return _json({"responses": responses}, 200)
 
 # --- Wallet and Transaction API ---
 
 @flask_app.route('/create-wallet', methods=['POST'])
 def api_create_wallet():
     """Generates a new wallet managed by the node and returns its address."""
-    if not current_node: return jsonify({"error": "Node not initialized"}), 503
     try:
         new_wallet = current_node.create_managed_wallet()
-        logging.info(f"API: Created new managed wallet via API: {new_wallet.get_address()}")
+        logging.info("API: Created new managed wallet via API: %s", new_wallet.get_address())
         # IMPORTANT: DO NOT return the private key in a real application API!
-        return jsonify({
+        return _json({
             "message": "Wallet created successfully (Managed by Node)",
             "address": new_wallet.get_address(),
-        }), 201
+        }, 201)
     except Exception as e:
-        logging.error(f"API /create-wallet Error: {e}", exc_info=True)
-        return jsonify({"error": "Internal server error during wallet creation"}), 500
+        logging.error("API /create-wallet Error: %s", e, exc_info=True)
+        return _json({"error": "Internal server error during wallet creation"}, 500)
 
 @flask_app.route('/wallets', methods=['GET'])
 def api_list_managed_wallets():
     """Lists the addresses of all wallets managed by this node."""
-    if not current_node: return jsonify({"error": "Node not initialized"}), 503
     try:
         addresses = current_node.get_all_managed_wallet_addresses()
-        return jsonify({"managed_wallets": addresses}), 200
-    except Exception as e: logging.error(f"API /wallets Error: {e}", exc_info=True); return jsonify({"error": "Internal server error"}), 500
+        return _json({"managed_wallets": addresses}, 200)
+    except Exception as e: logging.error("API /wallets Error: %s", e, exc_info=True); return _json({"error": "Internal server error"}, 500)
 
 @flask_app.route('/create-transaction', methods=['POST'])
 def api_create_transaction():
     """
     Creates and submits a transaction using a wallet MANAGED BY THIS NODE as the sender.
     Expects JSON: {"sender": "<sender_address>", "recipient": "<recipient_address>", "amount": <float>, "fee": <float>}
+    Amounts are in coins and converted to integer satoshis here.
+    Replies 202 once the transaction is queued; mempool admission happens asynchronously, so
+    202 does not mean the transaction was accepted. Poll the returned status_url
+    (/transaction-status/<transaction_id>) until it reports "accepted" or "rejected".
+    Replies 503 without queueing anything when the node is overloaded.
     """
-    if not current_node: return jsonify({"error": "Node not initialized"}), 503
-
-    data = request.get_json(silent=True)
-    if not data: return jsonify({"error": "Invalid request: Could not parse JSON data"}), 400
-    logging.debug(f"API /create-transaction received data: {data}") # Debug log
+    data = _request_json()
+    if not isinstance(data, dict) or not data: return _json({"error": "Invalid request: Could not parse JSON data"}, 400)
+    logging.debug("API /create-transaction received data: %s", data) # Not stringified unless DEBUG is on
 
     # --- Input Validation ---
     sender_addr = data.get("sender")
@@ -114,15 +241,15 @@ def api_create_transaction():
     amount_str = data.get("amount")
     fee_str = data.get("fee")
 
-    if not sender_addr or not isinstance(sender_addr, str) or len(sender_addr) != 64: return jsonify({"error": "Invalid or missing 'sender' address"}), 400
-    if not recipient_addr or not isinstance(recipient_addr, str) or len(recipient_addr) != 64: return jsonify({"error": "Invalid or missing 'recipient' address"}), 400
-    try: amount = float(amount_str); assert amount > 0
-    except: return jsonify({"error": "Invalid or missing 'amount' (must be positive number)"}), 400
-    try: fee = float(fee_str); assert fee >= 0
-    except: return jsonify({"error": "Invalid or missing 'fee' (must be non-negative number)"}), 400
+    if not _valid_addr(sender_addr): return _json({"error": "Invalid or missing 'sender' address"}, 400)
+    if not _valid_addr(recipient_addr): return _json({"error": "Invalid or missing 'recipient' address"}, 400)
+    try: amount = coins_to_satoshis(amount_str); assert amount > 0
+    except: return _json({"error": "Invalid or missing 'amount' (must be positive number)"}, 400)
+    try: fee = coins_to_satoshis(fee_str); assert fee >= 0
+    except: return _json({"error": "Invalid or missing 'fee' (must be non-negative number)"}, 400)
     # --- End Validation ---
 
-    logging.info(f"API: Received tx request: {amount} from managed {sender_addr[:10]} -> {recipient_addr[:10]} (fee: {fee})")
+    logging.info("API: Received tx request: %d sat from managed %.10s -> %.10s (fee: %d)", amount, sender_addr, recipient_addr, fee)
 
     try:
         # Use the node's method which finds the managed wallet and uses its key
@@ -132,39 +259,61 @@ def api_create_transaction():
 
         if not tx:
             # Reason should be logged by the node method
-            logging.warning(f"API: Transaction creation failed for sender {sender_addr[:10]}.")
+            logging.warning("API: Transaction creation failed for sender %.10s.", sender_addr)
             # Check if wallet exists first for better error message
             if not current_node.get_managed_wallet(sender_addr):
-                 return jsonify({"error": f"Sender address '{sender_addr}' not managed by this node."}), 400
+                 return _json({"error": f"Sender address '{sender_addr}' not managed by this node."}, 400)
             else:
                  # Likely insufficient funds if wallet exists
-                 return jsonify({"error": "Transaction creation failed (likely insufficient funds)"}), 400
+                 return _json({"error": "Transaction creation failed (likely insufficient funds)"}, 400)
+
+        # If transaction created, queue it for mempool admission and broadcast
+        tx_id = tx.transaction_id
+        _set_tx_status(tx_id, "pending") # Before queueing, so the drainer's outcome can't be overwritten
+        try: _tx_queue.put_nowait(tx)
+        except queue.Full:
+            with _tx_status_lock: _tx_status.pop(tx_id, None)
+            return _json({"error": "Node overloaded, try again later"}, 503)
+        # Mempool rejection reason (if any) is logged by the drainer
+        return _json({"message": "Transaction created and queued for broadcast", "transaction_id": tx_id,
+                      "status": "pending", "status_url": f"/transaction-status/{tx_id}"}, 202)
 
-        # If transaction created, submit it to mempool and broadcast
-        submitted = current_node.submit_and_broadcast_transaction(tx)
+    except Exception as e:
+        logging.error("API /create-transaction Error: %s", e, exc_info=True)
+        return _json({"error": "Internal server error during transaction processing"}, 500)
 
-        if submitted:
-            return jsonify({"message": "Transaction created and broadcast successfully", "transaction_id": tx.transaction_id}), 202
-        else:
-            # Mempool rejection reason should be logged
-            return jsonify({"error": "Transaction created but rejected by mempool"}), 400
 
-    except Exception as e:
-        logging.error(f"API /create-transaction Error: {e}", exc_info=True)
-        return jsonify({"error": "Internal server error during transaction processing"}), 500
+@flask_app.route('/transaction-status/<tx_id>', methods=['GET'])
+def api_transaction_status(tx_id: str):
+    """
+    Reports what happened to a transaction queued by /create-transaction:
+    "pending" (waiting for mempool admission), "accepted" (in the mempool and broadcast)
+    or "rejected". Unknown or long-forgotten ids get 404.
+    """
+    with _tx_status_lock:
+        status = _tx_status.get(tx_id)
+    if status is None:
+        return _json({"error": "Unknown transaction id"}, 404)
+    return _json({"transaction_id": tx_id, "status": status}, 200)
 
 
 # --- Flask Runner & Main Node Start ---
 def run_flask_app(host: str, port: int):
-    """Runs the Flask app."""
+    """Runs the Flask app under waitress (falls back to the threaded Flask dev server)."""
     try:
         logging.info(f"Starting Flask API server on http://{host}:{port}")
-        # Set threaded=True if needed, but Flask dev server is single-threaded by default
-        flask_app.run(host=host, port=port, debug=False, use_reloader=False) # Important: use_reloader=False
+        try:
+            from waitress import serve
+        except ImportError:
+            logging.warning("waitress not installed; using the Flask development server")
+            flask_app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True) # Important: use_reloader=False
+        else:
+            serve(flask_app, host=host, port=port, threads=API_THREADS)
     except OSError as e: logging.error(f"!!! Flask API Error on port {port}: {e}")
     except Exception as e: logging.error(f"!!! Flask API Error: {e}")
 
-def start_node_process(my_index: int, all_ips: list[str], base_p2p_port: int, base_api_port: int, difficulty: int):
+def start_node_process(my_index: int, all_ips: list[str], base_p2p_port: int, base_api_port: int, difficulty: int,
+                       mining_workers: int = DEFAULT_MINING_WORKERS):
     global current_node
     if my_index >= len(all_ips):
         logging.error(f"Index {my_index} out of bounds for IP list {all_ips}")
@@ -178,43 +327,54 @@ def start_node_process(my_index: int, all_ips: list[str], base_p2p_port: int, ba
     node_id = f"Node-{my_index+1}_{my_ip}_P2P:{p2p_port}_API:{api_port}"
     chain_file_base = CHAIN_FILE_PREFIX # Pass base prefix to Node
 
-    bootstrap_peers = [(ip, base_p2p_port + i) for i, ip in enumerate(all_ips) if i != my_index]
+    bootstrap_peers = tuple((ip, base_p2p_port + i) for i, ip in enumerate(all_ips) if i != my_index) # Read-only
 
     logging.info(f"--- Initializing {node_id} ---")
     logging.info(f"  P2P Listen: {listen_host}:{p2p_port}, API Listen: {listen_host}:{api_port}")
     logging.info(f"  Bootstrap Peers: {bootstrap_peers}")
     logging.info(f"  Chain File Base: {chain_file_base}{node_id}.json")
-    logging.info(f"  Difficulty: {difficulty}")
+    logging.info(f"  Difficulty: {difficulty}, Mining Workers: {mining_workers}")
 
     chain_file_path = f"{chain_file_base}{node_id}.json"
-    if os.path.exists(chain_file_path):
-        logging.info(f"  Removing existing chain file: {chain_file_path}")
-        try: os.remove(chain_file_path)
-        except OSError as e: logging.warning(f"Could not remove chain file: {e}")
+    try: # Single unlink instead of exists()+remove(); also race-free
+        os.unlink(chain_file_path)
+        logging.info(f"  Removed existing chain file: {chain_file_path}")
+    except FileNotFoundError: pass
+    except OSError as e: logging.warning(f"Could not remove chain file: {e}")
 
     # Create node instance
-    consensus = ProofOfWork(difficulty=difficulty)
-    node = Node(
-        host=listen_host, port=p2p_port, node_id=node_id, consensus=consensus,
-        bootstrap_peers=bootstrap_peers, chain_file_base=chain_file_base # Pass base prefix
-    )
+    consensus = ProofOfWork(difficulty=difficulty, workers=mining_workers)
+    try:
+        node = Node(
+            host=listen_host, port=p2p_port, node_id=node_id, consensus=consensus,
+            bootstrap_peers=bootstrap_peers, chain_file_base=chain_file_base # Pass base prefix
+        )
+    except ValueError as e: # e.g. a difficulty above what the fixed genesis block meets
+        logging.error(f"Cannot start node: {e}")
+        sys.exit(1)
     current_node = node
+    node_ready.set()
+    threading.Thread(target=_drain_tx_queue, daemon=True).start()
 
     # Start Flask API thread
     api_thread = threading.Thread(target=run_flask_app, args=(listen_host, api_port), daemon=True)
     api_thread.start()
 
+    # Main thread blocks on this until Ctrl+C / SIGTERM, so shutdown starts immediately
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
     # Start Node P2P/Mining
     try:
         node.start() # Start P2P listener & bootstrap connections
-        time.sleep(3) # Allow time for connections/API server to bind
-        node.start_mining() # Start the mining thread
-
-        logging.info(f"\n--- {node.id} Running (P2P on {p2p_port}, API on {api_port}) ---")
-        logging.info("--- Press Ctrl+C to stop ---")
-        while True: time.sleep(60) # Keep main thread alive
+        if not stop_event.wait(3): # Allow time for connections/API server to bind
+            node.start_mining() # Start the mining thread
 
-    except KeyboardInterrupt: logging.info(f"\n--- Stopping {node.id} ---")
+            logging.info(f"\n--- {node.id} Running (P2P on {p2p_port}, API on {api_port}) ---")
+            logging.info("--- Press Ctrl+C to stop ---")
+            stop_event.wait() # Keep main thread alive
+        logging.info(f"\n--- Stopping {node.id} ---")
     finally:
         if current_node: current_node.stop() # Calls save_chain inside
         logging.info(f"--- {node.id} Stopped ---")
@@ -227,6 +387,7 @@ if __name__ == "__main__":
     parser.add_argument("-d", "--difficulty", type=int, default=DEFAULT_DIFFICULTY, help=f"PoW difficulty (default: {DEFAULT_DIFFICULTY})")
     parser.add_argument("--p2p-port", type=int, default=DEFAULT_BASE_P2P_PORT, help=f"Base P2P port (default: {DEFAULT_BASE_P2P_PORT})")
     parser.add_argument("--api-port", type=int, default=DEFAULT_BASE_API_PORT, help=f"Base API port (default: {DEFAULT_BASE_API_PORT})")
+    parser.add_argument("--mining-workers", type=int, default=DEFAULT_MINING_WORKERS, help=f"Nonce search processes in a persistent worker pool (default: {DEFAULT_MINING_WORKERS}; 1 = mine on a node thread, sharing the GIL with the API/P2P threads)")
     args = parser.parse_args()
 
     cleaned_ips = [ip.split(':')[0] for ip in args.ips]
@@ -236,5 +397,5 @@ if __name__ == "__main__":
 
     start_node_process(
         my_index=args.index, all_ips=cleaned_ips, base_p2p_port=args.p2p_port,
-        base_api_port=args.api_port, difficulty=args.difficulty
+        base_api_port=args.api_port, difficulty=args.difficulty, mining_workers=args.mining_workers
     )
@@ -1,10 +1,11 @@
 # message
 
-import json
-from enum import Enum
-from typing import Dict, Any, Optional
+import struct
+import orjson
+from enum import IntEnum
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
 
-class MessageType(Enum):
+class MessageType(IntEnum): # Members are plain ints on the wire and compare equal to raw values
     NEW_TRANSACTION = 1
     NEW_BLOCK = 2
     GET_BLOCKS = 3 # Request blocks from a peer
@@ -14,35 +15,63 @@ class MessageType(Enum):
     ERROR = 7       # Send error message
     PING = 8
     PONG = 9
+    GET_UTXOS = 10         # Request an address's UTXOs
+    SEND_UTXOS = 11        # Reply to GET_UTXOS
+    GET_ALL_BALANCES = 12  # Request every known balance
+    SEND_ALL_BALANCES = 13 # Reply to GET_ALL_BALANCES
+
+_TYPE_SET = frozenset(int(t) for t in MessageType) # O(1) check of incoming type values
 
 # Simple Message Protocol using JSON
-# {"type": MessageType.value, "payload": {...}}
+# {"type": MessageType, "payload": {...}}
+# Framing: 4-byte big-endian body length, then the JSON body
+FRAME_HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 32 * 1024 * 1024 # Larger frames are treated as a protocol error
+
+def make_dispatch_table(handlers: Dict[MessageType, Callable]) -> Tuple[Optional[Callable], ...]:
+    """Builds a tuple indexed by message type value; types without a handler map to None."""
+    table: List[Optional[Callable]] = [None] * (max(MessageType) + 1)
+    for msg_type, handler in handlers.items():
+        table[msg_type] = handler
+    return tuple(table)
+
+def _frame(body: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(body)) + body
 
-def create_message(msg_type: MessageType, payload: Optional[Dict[str, Any]] = None) -> str:
-    """Creates a JSON message string."""
-    message = {"type": msg_type.value}
+def create_message(msg_type: MessageType, payload: Optional[Dict[str, Any]] = None) -> bytes:
+    """Creates a length-prefixed JSON message, ready to write to a socket."""
+    message = {"type": msg_type}
     if payload is not None:
         message["payload"] = payload
     try:
-        return json.dumps(message) + "\n" # Add newline as delimiter
-    except TypeError as e:
+        return _frame(orjson.dumps(message))
+    except TypeError as e: # orjson.JSONEncodeError is a TypeError
          print(f"Error serializing message payload for type {msg_type}: {e}")
          # Send error message instead?
-         return json.dumps({"type": MessageType.ERROR.value, "payload": {"error": "Serialization failed"}}) + "\n"
+         return _frame(orjson.dumps({"type": MessageType.ERROR, "payload": {"error": "Serialization failed"}}))
 
+def create_message_from_json(msg_type: MessageType, payload_json: bytes) -> bytes:
+    """
+    Like create_message, for a payload that is already JSON-encoded (e.g. Block.to_json()),
+    so it isn't serialized again. Produces the same bytes create_message would.
+    """
+    return _frame(b'{"type":%d,"payload":%b}' % (msg_type, payload_json))
 
-def parse_message(message_str: str) -> Optional[Dict[str, Any]]:
-    """Parses a JSON message string."""
+
+def parse_message(message_str: Union[bytes, bytearray, memoryview, str]) -> Optional[Dict[str, Any]]:
+    """Parses a JSON message body (a received frame, or str); None if invalid or of unknown type."""
+    if not message_str:
+        return None # Empty frame; skip the decode-error path
     try:
-        # Handle potential multiple messages if buffer contained more than one
-        message_str = message_str.strip()
-        if not message_str:
-             return None
-        # Assume one message per call for simplicity now
-        return json.loads(message_str)
-    except json.JSONDecodeError:
+        # orjson reads bytes-like buffers directly (no decode or copy) and skips surrounding whitespace itself
+        message = orjson.loads(message_str)
+        if message.get("type") not in _TYPE_SET:
+             return None # Unknown or missing message type
+        return message
+    except orjson.JSONDecodeError:
         # print(f"Error decoding JSON message: {message_str}")
         return None
     except Exception as e:
         # print(f"Unexpected error parsing message: {e}")
-        return None
\ No newline at end of file
+        return None
+
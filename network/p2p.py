@@ -1,230 +1,337 @@
+import asyncio
+import hashlib
 import socket
 import threading
-import json
-import time
-from typing import Set, Dict, Optional, Callable, List, Any
+from collections import OrderedDict
+from typing import Set, Dict, Optional, Callable, List, Any, Tuple
+
+from .message import MessageType, create_message, parse_message, FRAME_HEADER, MAX_MESSAGE_SIZE
+
+RECV_BUFFER_SIZE = 64 * 1024 # Per-connection receive buffer; grown for a larger frame, then shrunk back
+MAX_PEER_BACKLOG = 8 * 1024 * 1024 # Unsent bytes a peer may fall behind by before it is dropped
+SEEN_FRAMES_SIZE = 10_000 # Digests of recently relayed frames remembered to skip re-parsing copies
+SOCKET_BUFFER_SIZE = 1 << 20 # Kernel send/recv buffers, sized for bursts of large block broadcasts
+# TCP keepalive detects dead peers in the kernel: first probe after KEEPALIVE_IDLE seconds of
+# silence, then every KEEPALIVE_INTERVAL seconds, dropping the connection after KEEPALIVE_COUNT misses
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+def _tune_socket(sock) -> None:
+    """Enables TCP keepalive and enlarges the socket buffers of a peer connection."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                              ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+            if hasattr(socket, option): # Linux-specific tuning knobs
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    except OSError as e:
+        print(f"P2P Warning: Could not set socket options: {e}")
+
+
+def _frame_digest(body) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+class _PeerProtocol(asyncio.BufferedProtocol):
+    """
+    One peer connection. The event loop reads straight into a buffer owned by the
+    connection (recv_into), so receiving allocates nothing per packet; each complete
+    frame is handed to the node as a memoryview slice of that buffer.
+    """
+
+    def __init__(self, node: 'P2PNode', peer_addr: Optional[tuple[str, int]] = None):
+        self.node = node
+        self.peer_addr = peer_addr # None for incoming connections until connection_made
+        self.transport: Optional[asyncio.Transport] = None
+        self.registered = False
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._filled = 0
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            _tune_socket(sock)
+        if self.peer_addr is None:
+            addr = transport.get_extra_info('peername')
+            self.peer_addr = (addr[0], addr[1]) # Use tuple for consistency
+            print(f"P2P ({self.node.node_id}): Accepted connection from {self.peer_addr}")
+        self.registered = self.node._register_peer(self.peer_addr, transport)
+        if not self.registered:
+            transport.close()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._view[self._filled:]
+
+    def buffer_updated(self, nbytes: int):
+        self._filled += nbytes
+        filled = self._filled
+        offset = 0
+        header_size = FRAME_HEADER.size
+        while filled - offset >= header_size:
+            (size,) = FRAME_HEADER.unpack_from(self._buffer, offset)
+            if size > MAX_MESSAGE_SIZE:
+                print(f"P2P Error ({self.node.node_id}): Oversized message ({size} bytes) from {self.peer_addr}")
+                self.transport.close()
+                return
+            end = offset + header_size + size
+            if end > filled:
+                break # Frame incomplete; wait for more data
+            self.node._dispatch(self.peer_addr, self._view[offset + header_size:end])
+            offset = end
+
+        remaining = filled - offset
+        if offset:
+            self._buffer[:remaining] = self._buffer[offset:filled] # Move the partial frame to the front
+        self._filled = remaining
+        if remaining >= header_size:
+            needed = header_size + FRAME_HEADER.unpack_from(self._buffer, 0)[0]
+        else:
+            needed = header_size
+        if needed > len(self._buffer): # Frame larger than the buffer: grow once to fit it
+            self._resize_buffer(needed)
+        elif needed <= RECV_BUFFER_SIZE < len(self._buffer): # Large frame consumed: give the memory back
+            self._resize_buffer(RECV_BUFFER_SIZE)
+
+    def _resize_buffer(self, size: int):
+        """Replaces the receive buffer with one of `size` bytes, keeping the unconsumed bytes."""
+        resized = bytearray(size)
+        resized[:self._filled] = self._view[:self._filled]
+        self._buffer, self._view = resized, memoryview(resized)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if exc is None:
+            print(f"P2P ({self.node.node_id}): Connection closed by peer {self.peer_addr}")
+        else:
+            print(f"P2P Error ({self.node.node_id}): Socket error with peer {self.peer_addr}: {exc}")
+        if self.registered:
+            self.node._remove_peer(self.peer_addr, self.transport)
 
-from .message import MessageType, create_message, parse_message
 
 class P2PNode:
-    """Handles P2P network connections and message passing."""
+    """
+    Handles P2P network connections and message passing.
+    All sockets are served by one asyncio event loop running in a single background thread.
+    """
 
-    def __init__(self, host: str, port: int, node_id: str, message_handler: Callable[[str, Dict[str, Any]], None]):
+    def __init__(self, host: str, port: int, node_id: str, message_handler: Callable[[tuple[str, int], Dict[str, Any]], None]):
         self.host = host
         self.port = port
         self.node_id = node_id # For logging/identification
         self.peers: Set[tuple[str, int]] = set() # (host, port)
-        self.connections: Dict[tuple[str, int], socket.socket] = {}
-        self.server_socket: Optional[socket.socket] = None
+        self.connections: Dict[tuple[str, int], asyncio.Transport] = {}
+        # Immutable copy of connections.items(), republished on every change so fan-outs need no lock
+        self._connection_snapshot: Tuple[Tuple[tuple[str, int], asyncio.Transport], ...] = ()
         self.running = False
-        self.lock = threading.Lock() # Protect peers and connections
+        self.lock = threading.Lock() # Protect peers and connections (also read from node threads)
         self.message_handler = message_handler # Callback function in Node class
-        self.listen_thread: Optional[threading.Thread] = None
-        self.ping_thread: Optional[threading.Thread] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[threading.Thread] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        # Broadcasts waiting for the loop; everything queued before it runs goes out as one write per peer
+        self._outbox: List[tuple[bytes, Optional[tuple[str, int]], bool]] = []
+        self._outbox_lock = threading.Lock()
+        # Digests of frames this node has relayed (oldest evicted first), i.e. content it accepted.
+        # Rejected messages are never relayed, so they never land here. Loop thread only, so unlocked
+        self._seen_frames: "OrderedDict[bytes, None]" = OrderedDict()
 
 
     def start(self):
-        """Starts the server thread to listen for incoming connections."""
+        """Starts the event loop thread and the listening server."""
         if self.running:
             print(f"P2P ({self.node_id}): Already running.")
             return
 
         self.running = True
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
         try:
-             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-             self.server_socket.bind((self.host, self.port))
-             self.server_socket.listen(5)
+             self.server = asyncio.run_coroutine_threadsafe(
+                  self.loop.create_server(lambda: _PeerProtocol(self), self.host, self.port, reuse_address=True), self.loop
+             ).result()
              print(f"P2P ({self.node_id}): Listening on {self.host}:{self.port}")
 
-             self.listen_thread = threading.Thread(target=self._listen_for_connections, daemon=True)
-             self.listen_thread.start()
-
-             self.ping_thread = threading.Thread(target=self._ping_peers_loop, daemon=True)
-             self.ping_thread.start()
-
         except OSError as e:
              print(f"P2P Error ({self.node_id}): Could not start listener on {self.host}:{self.port}. {e}")
              self.running = False
-             if self.server_socket:
-                  self.server_socket.close()
+             self._stop_loop()
 
 
     def stop(self):
         """Stops the server and closes connections."""
         print(f"P2P ({self.node_id}): Stopping network...")
         self.running = False
-        if self.server_socket:
-            self.server_socket.close() # Will interrupt accept() in listener thread
-            print(f"P2P ({self.node_id}): Server socket closed.")
-
-        with self.lock:
-            peers_to_close = list(self.connections.keys()) # Copy keys before iterating
-            for peer_addr in peers_to_close:
-                conn = self.connections.pop(peer_addr, None)
-                if conn:
-                    try:
-                        conn.shutdown(socket.SHUT_RDWR)
-                        conn.close()
-                        print(f"P2P ({self.node_id}): Closed connection to {peer_addr}")
-                    except OSError as e:
-                        print(f"P2P Warning ({self.node_id}): Error closing connection to {peer_addr}: {e}")
-
-        if self.listen_thread and self.listen_thread.is_alive():
-             self.listen_thread.join(timeout=1.0)
-        if self.ping_thread and self.ping_thread.is_alive():
-             self.ping_thread.join(timeout=1.0)
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=2.0)
+        except Exception as e:
+            print(f"P2P Warning ({self.node_id}): Error during shutdown: {e}")
+        self._stop_loop()
         print(f"P2P ({self.node_id}): Network stopped.")
 
+    async def _shutdown(self):
+        """Loop coroutine: closes the server, every connection and the remaining peer tasks."""
+        if self.server:
+            self.server.close() # Stops accepting new connections
+            await self.server.wait_closed()
+            print(f"P2P ({self.node_id}): Server socket closed.")
 
-    def _listen_for_connections(self):
-        """Thread target: Listens for and handles incoming connections."""
-        while self.running and self.server_socket:
-            try:
-                conn, addr = self.server_socket.accept()
-                conn.settimeout(60.0) # Set a timeout for operations
-                peer_addr = (addr[0], addr[1]) # Use tuple for consistency
-                print(f"P2P ({self.node_id}): Accepted connection from {peer_addr}")
-
-                with self.lock:
-                    if peer_addr not in self.connections: # Avoid duplicate connections?
-                         self.peers.add(peer_addr)
-                         self.connections[peer_addr] = conn
-                         # Start a thread to handle messages from this specific peer
-                         handler_thread = threading.Thread(target=self._handle_peer, args=(conn, peer_addr), daemon=True)
-                         handler_thread.start()
-                    else:
-                         print(f"P2P ({self.node_id}): Already connected to {peer_addr}, closing new connection.")
-                         conn.close()
-
-            except OSError as e:
-                # This likely happens when the socket is closed by stop()
-                if self.running:
-                     print(f"P2P Error ({self.node_id}): Listener error: {e}")
-                break # Exit loop if socket closed or error
-            except Exception as e:
-                if self.running:
-                    print(f"P2P Error ({self.node_id}): Unexpected error accepting connection: {e}")
-
-
-    def _handle_peer(self, conn: socket.socket, peer_addr: tuple[str, int]):
-        """Thread target: Receives and processes messages from a single peer."""
-        buffer = ""
-        while self.running:
+        with self.lock:
+            peers_to_close = self._connection_snapshot
+            self.connections.clear()
+            self._connection_snapshot = ()
+        for peer_addr, transport in peers_to_close:
+            transport.close()
+            print(f"P2P ({self.node_id}): Closed connection to {peer_addr}")
+
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=1.0)
+        if not self.loop_thread.is_alive():
+             self.loop.close()
+
+
+    def _register_peer(self, peer_addr: tuple[str, int], transport: asyncio.Transport) -> bool:
+        """Records a new connection; False if one to the same address already exists."""
+        with self.lock:
+            if peer_addr in self.connections: # Avoid duplicate connections
+                print(f"P2P ({self.node_id}): Already connected to {peer_addr}, closing new connection.")
+                return False
+            self.peers.add(peer_addr)
+            self.connections[peer_addr] = transport
+            self._connection_snapshot = tuple(self.connections.items())
+        return True
+
+    def _dispatch(self, peer_addr: tuple[str, int], body: memoryview):
+        """Loop callback: parses one received frame and hands it to the Node."""
+        # Flooded gossip arrives once per peer as identical bytes; hashing the raw frame is far
+        # cheaper than decoding it, so copies of something already relayed are dropped before any JSON work
+        if self._seen_frames and _frame_digest(body) in self._seen_frames:
+            return
+        message = parse_message(body) # orjson reads the memoryview in place
+        if message:
+            # Use the callback to handle the message in the Node class
             try:
-                # Receive data in chunks
-                data = conn.recv(4096)
-                if not data:
-                    # Connection closed by peer
-                    print(f"P2P ({self.node_id}): Connection closed by peer {peer_addr}")
-                    break
-
-                buffer += data.decode('utf-8', errors='ignore')
-
-                # Process complete messages (separated by newline)
-                while '\n' in buffer:
-                    message_str, buffer = buffer.split('\n', 1)
-                    message = parse_message(message_str)
-                    if message:
-                        # Use the callback to handle the message in the Node class
-                        try:
-                            # Construct peer_id string for handler
-                            peer_id = f"{peer_addr[0]}:{peer_addr[1]}"
-                            self.message_handler(peer_id, message)
-                        except Exception as e:
-                             print(f"P2P Error ({self.node_id}): Error in message handler for peer {peer_addr}: {e}")
-
-            except socket.timeout:
-                # print(f"P2P ({self.node_id}): Socket timeout for peer {peer_addr}")
-                continue # Just means no data received recently
-            except OSError as e:
-                # Connection likely broken or closed
-                print(f"P2P Error ({self.node_id}): Socket error with peer {peer_addr}: {e}")
-                break
+                self.message_handler(peer_addr, message)
             except Exception as e:
-                print(f"P2P Error ({self.node_id}): Unexpected error handling peer {peer_addr}: {e}")
-                break # Exit on unexpected errors
-
-        # Cleanup connection when loop ends
-        self._remove_peer(peer_addr, conn)
+                 print(f"P2P Error ({self.node_id}): Error in message handler for peer {peer_addr}: {e}")
 
 
     def connect_to_peer(self, host: str, port: int):
-        """Establishes an outgoing connection to a peer."""
+        """Starts an outgoing connection to a peer (returns without waiting for it)."""
         if not self.running: return
         peer_addr = (host, port)
         # Avoid connecting to self or already connected peers
         if peer_addr == (self.host, self.port): return
         with self.lock:
              if peer_addr in self.connections: return
+        asyncio.run_coroutine_threadsafe(self._connect(peer_addr), self.loop)
 
+    async def _connect(self, peer_addr: tuple[str, int]):
+        """Loop coroutine: establishes an outgoing connection."""
         try:
             print(f"P2P ({self.node_id}): Attempting to connect to {peer_addr}...")
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.settimeout(10.0) # Connection timeout
-            conn.connect(peer_addr)
-            conn.settimeout(60.0) # Timeout for subsequent operations
-            print(f"P2P ({self.node_id}): Connected to {peer_addr}")
-
-            with self.lock:
-                 self.peers.add(peer_addr)
-                 self.connections[peer_addr] = conn
-
-            # Start handler thread for this new outgoing connection
-            handler_thread = threading.Thread(target=self._handle_peer, args=(conn, peer_addr), daemon=True)
-            handler_thread.start()
-
-            # Request peer list from newly connected peer
-            self.send_message(peer_addr, create_message(MessageType.GET_PEERS))
-
-        except socket.timeout:
+            transport, protocol = await asyncio.wait_for(
+                 self.loop.create_connection(lambda: _PeerProtocol(self, peer_addr), *peer_addr), timeout=10.0 # Connection timeout
+            )
+        except asyncio.TimeoutError:
              print(f"P2P ({self.node_id}): Connection attempt to {peer_addr} timed out.")
-             conn.close()
+             return
         except OSError as e:
             print(f"P2P Error ({self.node_id}): Could not connect to {peer_addr}. {e}")
-            conn.close()
-        except Exception as e:
-            print(f"P2P Error ({self.node_id}): Unexpected error connecting to {peer_addr}: {e}")
-            conn.close()
+            return
 
+        if not protocol.registered: # Raced with another connect/accept
+             return
+        print(f"P2P ({self.node_id}): Connected to {peer_addr}")
 
-    def send_message(self, peer_addr: tuple[str, int], message_str: str) -> bool:
-        """Sends a raw message string to a specific peer."""
-        with self.lock:
-            conn = self.connections.get(peer_addr)
-            if conn:
-                try:
-                    conn.sendall(message_str.encode('utf-8'))
-                    return True
-                except OSError as e:
-                    print(f"P2P Error ({self.node_id}): Failed to send message to {peer_addr}. {e}")
-                    # Assume connection is broken, initiate removal
-                    # Needs to be done carefully to avoid deadlocks if called from _handle_peer
-                    # Schedule removal or handle outside the lock if necessary
-                    # For simplicity here, we'll remove directly but it's risky
-                    self._remove_peer(peer_addr, conn, acquire_lock=False) # Already holding lock
-                    return False
-                except Exception as e:
-                    print(f"P2P Error ({self.node_id}): Unexpected error sending to {peer_addr}: {e}")
-                    self._remove_peer(peer_addr, conn, acquire_lock=False)
-                    return False
-            else:
-                 # print(f"P2P ({self.node_id}): Cannot send message, not connected to {peer_addr}")
-                 return False
-
-
-    def broadcast(self, message_str: str, exclude_peer: Optional[tuple[str, int]] = None):
-        """Sends a raw message string to all connected peers (optionally excluding one)."""
+        # Request peer list from newly connected peer
+        self._write(peer_addr, transport, create_message(MessageType.GET_PEERS))
+
+
+    def send_message(self, peer_addr: tuple[str, int], message_str: bytes) -> bool:
+        """
+        Queues an encoded message (see create_message) for a specific peer; safe from any thread.
+        Returns False if not connected to that peer.
+        """
         with self.lock:
-            # Create a list of peers to send to avoid issues if connections change during iteration
-            peers_to_send = list(self.connections.keys())
+            transport = self.connections.get(peer_addr)
+        if transport is None:
+             # print(f"P2P ({self.node_id}): Cannot send message, not connected to {peer_addr}")
+             return False
+        self.loop.call_soon_threadsafe(self._write, peer_addr, transport, message_str)
+        return True
+
+    def _write(self, peer_addr: tuple[str, int], transport: asyncio.Transport, message_str: bytes):
+        """Loop callback: writes a message to a peer's transport."""
+        if transport.is_closing():
+            self._remove_peer(peer_addr, transport)
+            return
+        if transport.get_write_buffer_size() > MAX_PEER_BACKLOG:
+            # Peer isn't reading; drop it rather than buffer without bound
+            print(f"P2P ({self.node_id}): Peer {peer_addr} too slow ({transport.get_write_buffer_size()} bytes unsent), disconnecting.")
+            self._remove_peer(peer_addr, transport)
+            return
+        try:
+            transport.write(message_str)
+        except Exception as e:
+            print(f"P2P Error ({self.node_id}): Failed to send message to {peer_addr}. {e}")
+            self._remove_peer(peer_addr, transport)
+
 
-        # print(f"P2P ({self.node_id}): Broadcasting message to {len(peers_to_send)} peers.")
-        for peer_addr in peers_to_send:
-             if peer_addr != exclude_peer:
-                 if not self.send_message(peer_addr, message_str):
-                      # Send failed, peer likely removed, continue broadcasting to others
-                      pass
+    def broadcast(self, message_str: bytes, exclude_peer: Optional[tuple[str, int]] = None, mark_seen: bool = False):
+        """
+        Sends an encoded message to all connected peers (optionally excluding one); safe from any thread.
+        mark_seen: the message relays content this node accepted, so identical frames received
+        later are dropped without being parsed.
+        """
+        if not self.running:
+            return
+        with self._outbox_lock:
+            self._outbox.append((message_str, exclude_peer, mark_seen))
+            first = len(self._outbox) == 1
+        if first: # Only the first message of a burst wakes the loop
+            self.loop.call_soon_threadsafe(self._flush_broadcasts)
+
+    def _flush_broadcasts(self):
+        """
+        Loop callback: writes every queued broadcast. Frames are self-delimiting, so each peer
+        gets its messages joined into a single write (one send syscall) instead of one per message.
+        Writes never block, so a slow peer can't hold up the others.
+        """
+        with self._outbox_lock:
+            pending, self._outbox = self._outbox, []
+        for message, exclude_peer, mark_seen in pending:
+            if mark_seen:
+                self._seen_frames[_frame_digest(memoryview(message)[FRAME_HEADER.size:])] = None
+                if len(self._seen_frames) > SEEN_FRAMES_SIZE:
+                    self._seen_frames.popitem(last=False)
+        if len(pending) == 1:
+            shared = pending[0][0]
+        else:
+            shared = b"".join(message for message, exclude_peer, mark_seen in pending) # For peers excluded from none
+        excluded = {exclude_peer for message, exclude_peer, mark_seen in pending if exclude_peer is not None}
+        # print(f"P2P ({self.node_id}): Broadcasting {len(pending)} messages to {len(self._connection_snapshot)} peers.")
+        for peer_addr, transport in self._connection_snapshot: # Unaffected by removals during the loop
+             if peer_addr in excluded:
+                 data = b"".join(message for message, exclude_peer, mark_seen in pending if exclude_peer != peer_addr)
+                 if not data:
+                     continue
+             else:
+                 data = shared
+             self._write(peer_addr, transport, data)
 
     def get_peer_list(self) -> List[tuple[str, int]]:
          """Returns a list of currently known peer addresses."""
@@ -233,43 +340,16 @@ class P2PNode:
               return list(self.peers)
 
 
-    def _remove_peer(self, peer_addr: tuple[str, int], conn: Optional[socket.socket] = None, acquire_lock: bool = True):
-         """Removes a peer and closes its connection."""
+    def _remove_peer(self, peer_addr: tuple[str, int], transport: Optional[asyncio.Transport] = None):
+         """Removes a peer and closes its connection. Runs on the loop thread."""
          # print(f"P2P ({self.node_id}): Removing peer {peer_addr}")
-         if acquire_lock:
-              self.lock.acquire()
-         try:
-              self.peers.discard(peer_addr)
-              removed_conn = self.connections.pop(peer_addr, None)
-              actual_conn_to_close = conn if conn else removed_conn
-
-              if actual_conn_to_close:
-                    try:
-                         # actual_conn_to_close.shutdown(socket.SHUT_RDWR) # Can cause issues if already closed
-                         actual_conn_to_close.close()
-                    except OSError:
-                         pass # Ignore errors if already closed
-         finally:
-              if acquire_lock:
-                   self.lock.release()
-
-    def _ping_peers_loop(self):
-         """Periodically sends PING messages to check connections."""
-         while self.running:
-              time.sleep(30) # Ping every 30 seconds
-              if not self.running: break
-              # print(f"P2P ({self.node_id}): Pinging peers...")
-              ping_message = create_message(MessageType.PING)
-              with self.lock:
-                   peers_to_ping = list(self.connections.keys())
-
-              disconnected_peers = []
-              for peer_addr in peers_to_ping:
-                   if not self.send_message(peer_addr, ping_message):
-                        # Send failed, assume disconnected
-                        disconnected_peers.append(peer_addr)
-                        print(f"P2P ({self.node_id}): Peer {peer_addr} failed ping, marked for removal.")
-
-              # Removing peers requires the lock again, do it after iteration
-              # for peer_addr in disconnected_peers:
-              #      self._remove_peer(peer_addr) # _remove_peer handles locking# p2p
\ No newline at end of file
+         with self.lock:
+              current = self.connections.get(peer_addr)
+              if transport is None or current is transport: # Don't drop a newer connection to the same address
+                   self.peers.discard(peer_addr)
+                   if self.connections.pop(peer_addr, None) is not None:
+                        self._connection_snapshot = tuple(self.connections.items())
+              transport_to_close = transport if transport else current
+
+         if transport_to_close and not transport_to_close.is_closing():
+              transport_to_close.close()
@@ -1,9 +1,10 @@
 import os
 import time
 import threading
-import random
 import logging # Use logging
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Iterator, Sequence, Tuple
 
 # Blockchain components
 # Use relative imports assuming node.py is at the project root
@@ -11,7 +12,7 @@ from typing import Optional, List, Dict, Any
 from blockchain.wallet import Wallet
 from blockchain.consensus import Consensus # ProofOfWork is usually passed in
 from blockchain.chain import Chain
-from blockchain.utxo import UTXOSet
+from blockchain.utxo import UTXOSet, UTXOOverlay
 from blockchain.mempool import Mempool
 from blockchain.block import Block
 from blockchain.transaction import Transaction
@@ -21,14 +22,17 @@ from blockchain import utils
 # Networking components
 # Assuming network components are in a 'network' subdirectory
 from network.p2p import P2PNode
-from network.message import MessageType, create_message, parse_message
+from network.message import MessageType, create_message, create_message_from_json, make_dispatch_table, parse_message
 
 # Constants
 CHAIN_FILE_PREFIX = "chain_data_node_" # Define prefix here or pass in
+SEEN_CACHE_SIZE = 10_000 # Recently gossiped transaction ids / block hashes remembered per kind
+HANDLER_ERROR_LOG_RATE = 5 # Handler failures logged per second at most; a peer sending junk can't flood the log
+PARALLEL_VERIFY_MIN = 64 # Block signatures below this count are verified inline rather than split across workers
 
 class Node:
     """Represents a node in the blockchain network with P2P and API capabilities."""
-    def __init__(self, host: str, port: int, node_id: str, consensus: Consensus, bootstrap_peers: List[tuple[str, int]] = [], chain_file_base: str = CHAIN_FILE_PREFIX):
+    def __init__(self, host: str, port: int, node_id: str, consensus: Consensus, bootstrap_peers: Sequence[tuple[str, int]] = (), chain_file_base: str = CHAIN_FILE_PREFIX):
         self.id = node_id
         self.consensus = consensus
         self.mempool = Mempool()
@@ -37,22 +41,61 @@ class Node:
         # Load/Create Chain
         loaded_chain = Chain.load_from_file(self.chain_file, self.consensus) if os.path.exists(self.chain_file) else None
         self.chain = loaded_chain if loaded_chain else Chain(self.consensus)
-        self.chain_lock = threading.Lock() # Protect chain and UTXO set access
+        # Protect chain, UTXO set and managed wallet access. Reentrant because the API,
+        # P2P and mining threads call query methods that take it from inside locked sections.
+        self.chain_lock = threading.RLock()
+        self._persist_lock = threading.Lock() # Serializes appends to the chain file
 
         # Initialize UTXO Set
         self.utxo_set = UTXOSet()
         with self.chain_lock: # Ensure consistent state during rebuild
              self.utxo_set.rebuild(self.chain)
+        # Immutable address -> balance snapshot, replaced (never mutated) after every block the node
+        # applies, so balance queries read it without waiting on chain_lock
+        self._balances_snapshot: Dict[str, int] = self.utxo_set.get_all_balances()
 
         # --- Wallet Management ---
         # Stores wallets generated/managed by this node instance
         # Key: address (str), Value: Wallet object
         # TODO: Persist/Load managed wallets for real use
         self.managed_wallets: Dict[str, Wallet] = {}
+        # Own lock so wallet lookups (every /create-transaction) never wait on block validation
+        self._wallets_lock = threading.Lock()
         self.node_wallet = self._create_or_load_node_wallet() # Node's own mining/operational wallet
         # -----------------------------
 
         # Initialize P2P Networking
+        # Transaction/block validation runs off the P2P loop thread so it keeps reading sockets.
+        # Transactions are independent and libsecp256k1 verification releases the GIL, so they
+        # use several workers; blocks build on each other and stay in arrival order on one worker.
+        self._tx_workers = os.cpu_count() or 1
+        self._tx_pool = ThreadPoolExecutor(max_workers=self._tx_workers, thread_name_prefix=f"{self.id}-tx")
+        self._block_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.id}-block")
+        # Peer queries that take chain_lock or encode large replies; kept off the loop for the same reason
+        self._query_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.id}-query")
+
+        # Gossip dedup: ids already received (insertion ordered, oldest evicted first), so copies
+        # relayed by several peers are parsed/validated/rebroadcast once
+        self._seen_txs: "OrderedDict[str, None]" = OrderedDict()
+        self._seen_blocks: "OrderedDict[str, None]" = OrderedDict()
+        self._seen_lock = threading.Lock()
+        # (window start, failures counted in it) for _log_handler_error
+        self._error_log_window = (0.0, 0)
+        self._error_log_lock = threading.Lock()
+        # NEW_BLOCK payloads waiting for the block worker, which applies whatever has
+        # piled up in one chain_lock acquisition (deque appends/pops are thread-safe)
+        self._pending_blocks: "deque[tuple[tuple[str, int], str, Dict[str, Any]]]" = deque()
+
+        # Message type -> handler, indexed directly by the wire type (None = ignored, e.g. PONG)
+        self._message_handlers = make_dispatch_table({
+            MessageType.NEW_TRANSACTION: self._offloaded(self._tx_pool, self._on_new_transaction, self._seen_txs, "transaction_id"),
+            MessageType.NEW_BLOCK: self._on_new_block,
+            MessageType.GET_PEERS: self._on_get_peers,
+            MessageType.SEND_PEERS: self._on_send_peers,
+            MessageType.PING: self._on_ping,
+            MessageType.GET_UTXOS: self._deferred(self._query_pool, self._on_get_utxos),
+            MessageType.GET_ALL_BALANCES: self._deferred(self._query_pool, self._on_get_all_balances),
+        })
         self.p2p_node = P2PNode(host, port, self.id, self._handle_network_message)
         self.bootstrap_peers = bootstrap_peers
 
@@ -60,6 +103,9 @@ class Node:
         self.is_mining = False
         self.mining_thread: Optional[threading.Thread] = None
         self.stop_mining_flag = threading.Event()
+        # Set when the miner may have something new to do (transaction admitted, block applied,
+        # stop requested), so an idle miner wakes at once instead of sleeping out a fixed delay
+        self.work_available = threading.Event()
 
         logging.info(f"Node {self.id} initialized. Node Wallet Addr: {self.node_wallet.get_address()}. Chain: {len(self.chain.blocks)}. UTXOs: {len(self.utxo_set)}")
 
@@ -80,19 +126,19 @@ class Node:
         wallet = Wallet()
         # Use lock if multiple threads might call this (e.g., multiple API requests)
         # For simple Flask, GIL might suffice, but lock is safer.
-        with self.chain_lock: # Reuse chain_lock for simplicity or add dedicated wallet_lock
+        with self._wallets_lock:
              self.managed_wallets[wallet.get_address()] = wallet
         logging.info(f"Node {self.id}: Created managed wallet: {wallet.get_address()}")
         return wallet
 
     def get_managed_wallet(self, address: str) -> Optional[Wallet]:
         """Retrieves a stored managed wallet by address."""
-        with self.chain_lock: # Protect read access if create uses lock
+        with self._wallets_lock: # Protect read access if create uses lock
              return self.managed_wallets.get(address)
 
     def get_all_managed_wallet_addresses(self) -> List[str]:
         """Returns addresses of all wallets managed by this node."""
-        with self.chain_lock:
+        with self._wallets_lock:
              # Return list of keys including the primary node wallet
              return list(self.managed_wallets.keys())
 
@@ -103,45 +149,58 @@ class Node:
             new_block = None
             # Acquire lock only when accessing shared chain/utxo state
             with self.chain_lock:
-                 current_utxo_copy = self.utxo_set.get_copy()
-                 last_block_copy = self.chain.get_last_block() # Get latest block info
+                 # Validates candidates through an overlay of the live set, so no UTXO copy is needed.
+                 # Only UTXO checks run under the lock; the mined block's signatures are all verified
+                 # by _apply_block before it is added
+                 template = miner.build_block_template(self.mempool, self.utxo_set, self.chain, self.node_wallet.get_address(),
+                                                       verify_signatures=False)
 
-            if not last_block_copy:
+            if template is None:
                  logging.error(f"Node {self.id}: Mining loop error - No last block found.")
-                 time.sleep(5); continue # Wait before retrying
+                 self._wait_for_work(); continue # Wait before retrying
 
             # Mine outside the lock - takes time
-            new_block = miner.mine_new_block(
-                self.mempool, # Assume mempool is reasonably thread-safe for reads
-                current_utxo_copy, # Miner validates against this snapshot
-                self.chain, # Only needs last_block info, doesn't modify
-                self.node_wallet.get_address(),
-                self.consensus
-            )
+            try:
+                 new_block = miner.mine_template(template, self.consensus)
+            except RuntimeError as e: # Search cancelled on shutdown, exhausted, or a worker died
+                 if self.stop_mining_flag.is_set(): break
+                 logging.error(f"Node {self.id}: Mining attempt failed: {e}")
+                 self._wait_for_work(); continue
 
             if self.stop_mining_flag.is_set(): break
 
             if new_block:
-                # Attempt to add block (requires lock)
-                block_added = False
-                with self.chain_lock:
-                     block_added = self.chain.add_block(new_block, self.utxo_set) # Validate and add
+                mined_tx_ids = [tx.transaction_id for tx in new_block.transactions if not tx.is_coinbase()]
+                # Signatures are verified before chain_lock is taken; the lock covers only the tip
+                # check and UTXO application
+                block_added = self._apply_block(new_block)
 
                 if block_added:
                     logging.info(f"Node {self.id}: Added mined block {new_block.index} (Tx:{len(new_block.transactions)}, Hash:{new_block.hash[:10]})")
-                    block_msg = create_message(MessageType.NEW_BLOCK, payload=new_block.to_dict())
-                    self.p2p_node.broadcast(block_msg)
-                    mined_tx_ids = [tx.transaction_id for tx in new_block.transactions if not tx.is_coinbase()]
+                    self._first_sighting(self._seen_blocks, new_block.hash) # Ignore it when peers relay it back
+                    block_msg = create_message_from_json(MessageType.NEW_BLOCK, new_block.to_json()) # Encoding reused by the chain file
+                    self.p2p_node.broadcast(block_msg, mark_seen=True)
                     self.mempool.remove_transactions(mined_tx_ids)
+                    self._persist_new_blocks()
                 else:
                     logging.warning(f"Node {self.id}: Mined block {new_block.index} rejected by own chain. Discarding.")
+                    # Templates skip signature checks, so a bad signature would be picked again on every
+                    # rebuild; evict the transactions responsible before building the next one
+                    bad_tx_ids = self._invalid_signature_tx_ids(new_block)
+                    if bad_tx_ids:
+                         logging.warning(f"Node {self.id}: Evicting {len(bad_tx_ids)} tx(s) with invalid signatures from the mempool.")
+                         self.mempool.remove_transactions(bad_tx_ids, mined=False)
             else:
-                # No block mined (e.g., no txs in mempool), wait before next attempt
-                if not self.stop_mining_flag.wait(random.uniform(2.0, 5.0)): continue
-                else: break # Stop flag was set during wait
+                # No block mined, wait for new transactions/blocks before the next attempt
+                self._wait_for_work()
 
         logging.info(f"Node {self.id}: Mining thread finished.")
 
+    def _wait_for_work(self, timeout: float = 30.0):
+        """Blocks the miner until work_available is set (or timeout), then re-arms it."""
+        self.work_available.wait(timeout)
+        self.work_available.clear()
+
     def start_mining(self):
         if self.is_mining: logging.info(f"Node {self.id}: Already mining."); return
         self.is_mining = True
@@ -154,6 +213,7 @@ class Node:
         if not self.is_mining or not self.mining_thread: logging.info(f"Node {self.id}: Not mining."); return
         logging.info(f"Node {self.id}: Signaling mining thread to stop...")
         self.stop_mining_flag.set()
+        self.work_available.set() # Wake it if idle
         self.mining_thread.join(timeout=2.0)
         if self.mining_thread.is_alive(): logging.warning(f"Node {self.id}: Mining thread join timed out.")
         self.is_mining = False; self.mining_thread = None
@@ -163,74 +223,229 @@ class Node:
     def _handle_network_message(self, peer_addr_tuple: tuple[str, int], message: Dict[str, Any]):
         peer_id_str = f"{peer_addr_tuple[0]}:{peer_addr_tuple[1]}"
         try:
-            msg_type_val = message.get("type")
-            payload = message.get("payload")
-            msg_type = MessageType(msg_type_val) if msg_type_val is not None else None
-            # logging.debug(f"Node {self.id}: Rcvd msg type {msg_type} from {peer_id_str}")
-
-            # --- Handle NEW_TRANSACTION ---
-            if msg_type == MessageType.NEW_TRANSACTION and payload:
-                tx = Transaction.from_dict(payload)
-                if self.mempool.add_transaction(tx):
-                     # Basic gossip
-                     tx_msg = create_message(MessageType.NEW_TRANSACTION, payload=payload)
-                     self.p2p_node.broadcast(tx_msg, exclude_peer=peer_addr_tuple)
-
-            # --- Handle NEW_BLOCK ---
-            elif msg_type == MessageType.NEW_BLOCK and payload:
-                block = Block.from_dict(payload)
-                # logging.info(f"Node {self.id}: Rcvd block {block.index} from {peer_id_str}. Validating...")
-                block_accepted = False
-                with self.chain_lock:
-                     block_accepted = self.chain.add_block(block, self.utxo_set)
-                if block_accepted:
-                     logging.info(f"Node {self.id}: Accepted block {block.index} from {peer_id_str}. (Hash:{block.hash[:10]})")
-                     tx_ids = [tx.transaction_id for tx in block.transactions if not tx.is_coinbase()]
-                     self.mempool.remove_transactions(tx_ids)
-                     # Basic gossip
-                     block_msg = create_message(MessageType.NEW_BLOCK, payload=payload)
-                     self.p2p_node.broadcast(block_msg, exclude_peer=peer_addr_tuple)
-
-            # --- Handle GET_PEERS ---
-            elif msg_type == MessageType.GET_PEERS:
-                 peer_list = self.p2p_node.get_peer_list()
-                 peer_list_str = [f"{host}:{port}" for host, port in peer_list]
-                 response = create_message(MessageType.SEND_PEERS, payload={"peers": peer_list_str})
-                 self.p2p_node.send_message(peer_addr_tuple, response)
-
-            # --- Handle SEND_PEERS ---
-            elif msg_type == MessageType.SEND_PEERS and payload and "peers" in payload:
-                 for peer_str in payload["peers"]:
-                      try: host, port_str = peer_str.split(':'); port = int(port_str); self.p2p_node.connect_to_peer(host, port)
-                      except: pass # Ignore errors
-
-            # --- Handle PING/PONG ---
-            elif msg_type == MessageType.PING:
-                 self.p2p_node.send_message(peer_addr_tuple, create_message(MessageType.PONG))
-            elif msg_type == MessageType.PONG: pass # Liveness check response
-
-            # --- Handle Balance/UTXO Queries ---
-            elif msg_type == MessageType.GET_UTXOS and payload and "address" in payload:
-                 req_address = payload["address"]
-                 with self.chain_lock: utxos = self.utxo_set.find_utxos_for_address(req_address)
-                 utxos_payload = {f"{txid}:{idx}": out.to_dict() for (txid, idx), out in utxos.items()}
-                 resp = create_message(MessageType.SEND_UTXOS, payload={"address": req_address, "utxos": utxos_payload})
-                 self.p2p_node.send_message(peer_addr_tuple, resp)
-
-            elif msg_type == MessageType.GET_ALL_BALANCES:
-                  with self.chain_lock: balances = self.get_all_balances() # Use internal method
-                  resp = create_message(MessageType.SEND_ALL_BALANCES, payload={"balances": balances})
-                  self.p2p_node.send_message(peer_addr_tuple, resp)
+            # parse_message only lets known MessageType values through, so this indexes the table directly
+            handler = self._message_handlers[message["type"]]
+            # logging.debug(f"Node {self.id}: Rcvd msg type {message['type']} from {peer_id_str}")
+            if handler is not None:
+                handler(peer_addr_tuple, peer_id_str, message.get("payload"))
+        except Exception as e:
+            self._log_handler_error(peer_id_str, e)
+
+    def _log_handler_error(self, peer_id_str: str, e: Exception):
+        """Logs a message handler failure, rate limited; the traceback is only logged at DEBUG level."""
+        now = time.monotonic()
+        with self._error_log_lock:
+            window_start, logged = self._error_log_window
+            if now - window_start >= 1.0:
+                window_start, logged = now, 0
+            self._error_log_window = (window_start, logged + 1)
+        if logged >= HANDLER_ERROR_LOG_RATE:
+            return
+        logging.error(f"Node {self.id}: Error handling msg from {peer_id_str}: {e}")
+        logging.debug("Message handler traceback", exc_info=True)
+
+    def _offloaded(self, pool: Executor, handler, seen: "OrderedDict[str, None]", id_field: str):
+        """
+        Wraps a gossip handler so it runs on `pool` instead of the P2P loop thread.
+        Payloads whose `id_field` is already in `seen` are dropped before any work is queued.
+        """
+        def submit(peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+            item_id = self._claim_gossip(seen, payload, id_field)
+            if item_id is None:
+                return
+            pool.submit(self._run_offloaded, handler, seen, item_id, peer_addr_tuple, peer_id_str, payload)
+        return submit
+
+    def _deferred(self, pool: Executor, handler):
+        """Wraps a request handler so it runs on `pool` instead of the P2P loop thread."""
+        def submit(peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+            pool.submit(self._run_deferred, handler, peer_addr_tuple, peer_id_str, payload)
+        return submit
+
+    def _run_deferred(self, handler, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+        try:
+            handler(peer_addr_tuple, peer_id_str, payload)
+        except Exception as e:
+            self._log_handler_error(peer_id_str, e)
 
+    def _claim_gossip(self, seen: "OrderedDict[str, None]", payload: Optional[Dict[str, Any]], id_field: str) -> Optional[str]:
+        """Returns the payload's `id_field` if this is its first sighting, else None."""
+        item_id = payload.get(id_field) if isinstance(payload, dict) else None
+        if not isinstance(item_id, str) or not self._first_sighting(seen, item_id):
+            return None
+        return item_id
+
+    def _forget_seen(self, seen: "OrderedDict[str, None]", item_id: str):
+        with self._seen_lock:
+            seen.pop(item_id, None)
+
+    def _first_sighting(self, seen: "OrderedDict[str, None]", item_id: str) -> bool:
+        """Records item_id as seen; False if it already was."""
+        with self._seen_lock:
+            if item_id in seen:
+                return False
+            seen[item_id] = None
+            if len(seen) > SEEN_CACHE_SIZE:
+                seen.popitem(last=False) # Evict the oldest
+            return True
+
+    def _run_offloaded(self, handler, seen: "OrderedDict[str, None]", item_id: str,
+                       peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+        accepted = False
+        try:
+            accepted = handler(peer_addr_tuple, peer_id_str, payload)
         except Exception as e:
-            logging.error(f"Node {self.id}: Error handling msg from {peer_id_str}: {e}")
-            import traceback; traceback.print_exc()
+            self._log_handler_error(peer_id_str, e)
+        if not accepted:
+            # Forget rejected ids so a bogus copy can't shadow a valid one relayed later
+            self._forget_seen(seen, item_id)
+
+    # --- Handle NEW_TRANSACTION ---
+    def _on_new_transaction(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]) -> bool:
+        if not payload: return False
+        tx = Transaction.from_dict(payload)
+        if self.mempool.add_transaction(tx, fee=self._transaction_fee(tx)):
+             self.work_available.set()
+             # Basic gossip
+             tx_msg = create_message(MessageType.NEW_TRANSACTION, payload=payload)
+             self.p2p_node.broadcast(tx_msg, exclude_peer=peer_addr_tuple, mark_seen=True)
+             return True
+        return False
+
+    # --- Handle NEW_BLOCK ---
+    def _on_new_block(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+        """Loop thread: queues a first-seen block for the block worker."""
+        if self._claim_gossip(self._seen_blocks, payload, "hash") is None:
+            return
+        self._pending_blocks.append((peer_addr_tuple, peer_id_str, payload))
+        self._block_pool.submit(self._apply_pending_blocks)
+
+    def _apply_pending_blocks(self):
+        """
+        Block worker: applies every queued block under a single chain_lock acquisition,
+        lowest index first, so a burst of blocks (e.g. catching up) doesn't pay one lock
+        hand-off and one balances snapshot per block. Usually the first task drains the
+        whole burst and the tasks queued behind it find nothing left to do.
+        """
+        batch = []
+        while self._pending_blocks:
+            peer_addr_tuple, peer_id_str, payload = self._pending_blocks.popleft()
+            try:
+                batch.append((Block.from_dict(payload), peer_addr_tuple, peer_id_str, payload))
+            except Exception as e:
+                self._log_handler_error(peer_id_str, e)
+                self._forget_seen(self._seen_blocks, payload["hash"])
+        # Signatures need no chain state, so check them before taking chain_lock
+        signatures_ok = self._verify_block_signatures([entry[0] for entry in batch])
+        for entry, ok in zip(batch, signatures_ok):
+            if not ok:
+                logging.warning(f"Node {self.id}: Block {entry[0].index} from {entry[2]} has an invalid signature. Rejected.")
+                self._forget_seen(self._seen_blocks, entry[0].hash)
+        batch = [entry for entry, ok in zip(batch, signatures_ok) if ok]
+        if not batch:
+            return
+        batch.sort(key=lambda entry: entry[0].index)
+
+        accepted = []
+        with self.chain_lock:
+            # Write-back layer for the batch: blocks update the overlay, and the UTXO set and
+            # its indices are touched once at the end (outputs created and spent in between never are)
+            batch_utxos = UTXOOverlay(self.utxo_set)
+            for entry in batch:
+                block = entry[0]
+                try:
+                    block_added = self.chain.add_block(block, batch_utxos, signatures_verified=True) # Verified above
+                except Exception as e:
+                    self._log_handler_error(entry[2], e)
+                    block_added = False
+                if block_added:
+                    accepted.append(entry)
+                else:
+                    # Forget rejected ids so a bogus copy can't shadow a valid one relayed later
+                    self._forget_seen(self._seen_blocks, block.hash)
+            if accepted:
+                self.utxo_set.apply_overlay(batch_utxos)
+                self._publish_balances()
+                self.work_available.set()
+
+        for block, peer_addr_tuple, peer_id_str, payload in accepted:
+             logging.info(f"Node {self.id}: Accepted block {block.index} from {peer_id_str}. (Hash:{block.hash[:10]})")
+             tx_ids = [tx.transaction_id for tx in block.transactions if not tx.is_coinbase()]
+             self.mempool.remove_transactions(tx_ids)
+             # Basic gossip. Relays our canonical encoding, which the chain file append below reuses
+             block_msg = create_message_from_json(MessageType.NEW_BLOCK, block.to_json())
+             self.p2p_node.broadcast(block_msg, exclude_peer=peer_addr_tuple, mark_seen=True)
+        if accepted:
+             self._persist_new_blocks()
+
+    def _verify_block_signatures(self, blocks: List[Block]) -> List[bool]:
+        """
+        Checks every input signature of the given blocks; one result per block. Large sets are
+        split across the transaction pool, where libsecp256k1 verifies in parallel without the GIL.
+        """
+        owners: List[int] = []
+        triples: List[Tuple[str, bytes, str]] = []
+        results = [True] * len(blocks)
+        for i, block in enumerate(blocks):
+            block_triples = Chain.block_signatures(block)
+            if block_triples is None:
+                results[i] = False
+                continue
+            triples.extend(block_triples)
+            owners.extend([i] * len(block_triples))
+
+        workers = self._tx_workers
+        if len(triples) < PARALLEL_VERIFY_MIN or workers < 2:
+            verified = utils.verify_many(triples)
+        else:
+            chunk = -(-len(triples) // workers) # Ceiling division
+            try:
+                verified = [ok for part in self._tx_pool.map(utils.verify_many, [triples[j:j + chunk] for j in range(0, len(triples), chunk)]) for ok in part]
+            except Exception as e: # Pool shut down while stopping
+                logging.error(f"Node {self.id}: Signature verification failed: {e}")
+                return [False] * len(blocks)
+        for owner, ok in zip(owners, verified):
+            if not ok:
+                results[owner] = False
+        return results
+
+    # --- Handle GET_PEERS ---
+    def _on_get_peers(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+         peer_list = self.p2p_node.get_peer_list()
+         peer_list_str = [f"{host}:{port}" for host, port in peer_list]
+         response = create_message(MessageType.SEND_PEERS, payload={"peers": peer_list_str})
+         self.p2p_node.send_message(peer_addr_tuple, response)
+
+    # --- Handle SEND_PEERS ---
+    def _on_send_peers(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+         if not payload or "peers" not in payload: return
+         for peer_str in payload["peers"]:
+              try: host, port_str = peer_str.split(':'); port = int(port_str); self.p2p_node.connect_to_peer(host, port)
+              except: pass # Ignore errors
+
+    # --- Handle PING/PONG ---
+    def _on_ping(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+         self.p2p_node.send_message(peer_addr_tuple, create_message(MessageType.PONG))
+
+    # --- Handle Balance/UTXO Queries ---
+    def _on_get_utxos(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+         if not payload or "address" not in payload: return
+         req_address = payload["address"]
+         with self.chain_lock: utxos = self.utxo_set.find_utxos_for_address(req_address)
+         utxos_payload = {f"{txid}:{idx}": out.to_dict() for (txid, idx), out in utxos.items()}
+         resp = create_message(MessageType.SEND_UTXOS, payload={"address": req_address, "utxos": utxos_payload})
+         self.p2p_node.send_message(peer_addr_tuple, resp)
+
+    def _on_get_all_balances(self, peer_addr_tuple: tuple[str, int], peer_id_str: str, payload: Optional[Dict[str, Any]]):
+          balances = self.get_all_balances() # Published snapshot; no lock needed
+          resp = create_message(MessageType.SEND_ALL_BALANCES, payload={"balances": balances})
+          self.p2p_node.send_message(peer_addr_tuple, resp)
 
     # --- Transaction Creation via API (Using Managed Wallet) ---
     def create_transaction_from_managed_wallet(
-        self, sender_address: str, recipient_address: str, amount: float, fee: float
+        self, sender_address: str, recipient_address: str, amount: int, fee: int
     ) -> Optional[Transaction]:
-        """Creates a transaction using a wallet MANAGED BY THIS NODE."""
+        """Creates a transaction using a wallet MANAGED BY THIS NODE (amounts in satoshis)."""
         sender_wallet = self.get_managed_wallet(sender_address) # Read access to dict
         if not sender_wallet:
             logging.error(f"Node {self.id}: Sender wallet {sender_address} not managed by this node.")
@@ -245,38 +460,95 @@ class Node:
         return tx
 
     # --- Transaction Submission/Broadcast ---
-    def submit_and_broadcast_transaction(self, transaction: Transaction) -> bool:
-         """Adds a valid transaction to the mempool and broadcasts it."""
-         if self.mempool.add_transaction(transaction): # Basic validation inside
+    def _transaction_fee(self, transaction: Transaction) -> int:
+        """Fee in satoshis paid by a transaction spending confirmed UTXOs (0 if an input is unknown)."""
+        total_input_value = 0
+        with self.chain_lock:
+             for inp in transaction.inputs:
+                  spent_utxo = self.utxo_set.get_utxo(inp.transaction_id, inp.output_index)
+                  if spent_utxo is None: return 0
+                  total_input_value += spent_utxo.amount
+        total_output_value = sum(out.amount for out in transaction.outputs)
+        return max(total_input_value - total_output_value, 0)
+
+    def submit_and_broadcast_transaction(self, transaction: Transaction, signed_locally: bool = False) -> bool:
+         """
+         Adds a valid transaction to the mempool and broadcasts it.
+         signed_locally: the transaction was just signed by a managed wallet, so its
+         signatures are not re-verified on the way into the mempool.
+         """
+         fee = self._transaction_fee(transaction)
+         if self.mempool.add_transaction(transaction, fee=fee, verify_signatures=not signed_locally): # Basic validation inside
+              self.work_available.set()
+              self._first_sighting(self._seen_txs, transaction.transaction_id) # Ignore it when peers relay it back
               tx_msg = create_message(MessageType.NEW_TRANSACTION, payload=transaction.to_dict())
-              self.p2p_node.broadcast(tx_msg)
+              self.p2p_node.broadcast(tx_msg, mark_seen=True)
               logging.info(f"Node {self.id}: Tx {transaction.transaction_id[:10]} added to mempool and broadcast.")
               return True
          else:
               logging.warning(f"Node {self.id}: Tx {transaction.transaction_id[:10]} rejected by mempool.")
               return False
 
+    def _invalid_signature_tx_ids(self, block: Block) -> List[str]:
+        """Ids of the block's non-coinbase transactions that are malformed or fail a signature check."""
+        bad_tx_ids = []
+        for tx in block.transactions:
+            if tx.is_coinbase():
+                continue
+            triples = Chain.transaction_signatures(tx)
+            if triples is None or not all(utils.verify_many(triples)):
+                bad_tx_ids.append(tx.transaction_id)
+        return bad_tx_ids
+
+    def _apply_block(self, block: Block) -> bool:
+        """
+        Validates and adds a block, then publishes the new balances snapshot.
+        Every input signature is verified first, outside chain_lock; this (and the batch path in
+        _apply_pending_blocks) is the only place add_block is told signatures_verified=True.
+        """
+        if not self._verify_block_signatures([block])[0]:
+            logging.warning(f"Node {self.id}: Block {block.index} has an invalid signature. Rejected.")
+            return False
+        with self.chain_lock:
+            if not self.chain.add_block(block, self.utxo_set, signatures_verified=True): # Verified just above
+                return False
+            self._publish_balances()
+        self.work_available.set()
+        return True
+
+    def _publish_balances(self):
+        """Replaces the balances snapshot read by the query methods. Caller holds chain_lock."""
+        self._balances_snapshot = self.utxo_set.get_all_balances() # Single reference swap for readers
+
     # --- Query Methods ---
-    def get_balance(self, address: Optional[str] = None) -> float:
+    # Balance queries read the published snapshot without taking chain_lock, so they
+    # never queue behind block validation.
+    def get_balance(self, address: Optional[str] = None) -> int:
         target_address = address if address else self.node_wallet.get_address()
-        with self.chain_lock: balance = self.utxo_set.get_balance(target_address)
-        return balance
+        return self._balances_snapshot.get(target_address, 0)
 
-    def get_all_balances(self) -> Dict[str, float]:
-        balances = {}
-        with self.chain_lock:
-            known_addresses = set(out.lock_script for out in self.utxo_set.utxos.values())
-            for addr in known_addresses:
-                balances[addr] = self.utxo_set.get_balance(addr) # get_balance re-iterates but is safe within lock
-        return balances
+    def get_balances(self, addresses: List[str]) -> Dict[str, int]:
+        """Balances (satoshis) for several addresses from one consistent snapshot."""
+        snapshot = self._balances_snapshot
+        return {addr: snapshot.get(addr, 0) for addr in addresses}
+
+    def get_all_balances(self) -> Dict[str, int]:
+        """All address balances (satoshis). The returned dict is shared between callers; don't mutate it."""
+        return self._balances_snapshot
+
+    def iter_balances(self) -> Iterator[Tuple[str, int]]:
+        """Yields (address, balance) pairs from the current balances snapshot; safe to consume without the lock."""
+        yield from self.get_all_balances().items()
 
     def get_status(self) -> Dict[str, Any]:
-         with self.chain_lock:
-              chain_len = len(self.chain.blocks)
-              utxo_count = len(self.utxo_set)
+         # Plain len()/dict reads are atomic under the GIL, so don't take chain_lock here:
+         # status polls would otherwise wait out every block being validated/applied.
+         # The figures may straddle a block that is mid-apply, which is fine for status.
+         chain_len = len(self.chain.blocks)
+         utxo_count = len(self.utxo_set)
          mempool_size = len(self.mempool)
          peer_count = len(self.p2p_node.peers) # Read access likely ok without lock if P2PNode manages its own
-         node_balance = self.get_balance(self.node_wallet.get_address()) # Use own method
+         node_balance = self.get_balance()
 
          return {
               "node_id": self.id,
@@ -302,12 +574,19 @@ class Node:
     def stop(self):
         logging.info(f"Node {self.id}: Stopping...")
         self.stop_mining()
+        self.consensus.close() # Stops nonce search workers, if any were started
         self.p2p_node.stop()
+        for pool in (self._tx_pool, self._block_pool, self._query_pool): # Let the running handler finish, drop queued ones
+             pool.shutdown(wait=True, cancel_futures=True)
         self.save_chain() # Save chain state on stop
         logging.info(f"Node {self.id}: Stopped.")
 
     def save_chain(self):
          logging.info(f"Node {self.id}: Saving chain to {self.chain_file}...")
-         with self.chain_lock:
-              self.chain.save_to_file(self.chain_file)
+         self._persist_new_blocks()
          logging.info(f"Node {self.id}: Chain saved.")
+
+    def _persist_new_blocks(self):
+         """Appends blocks not yet in the chain file. File I/O happens without chain_lock."""
+         with self._persist_lock:
+              self.chain.append_to_file(self.chain_file)
@@ -0,0 +1,75 @@
+import os
+import queue
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from blockchain import miner
+from blockchain.consensus import ProofOfWork
+from node import Node
+
+
+class CreateTransactionTest(unittest.TestCase):
+    """/create-transaction against a funded node that is not networked or mining."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.node = Node(host="127.0.0.1", port=0, node_id="api-test", consensus=ProofOfWork(difficulty=1),
+                        chain_file_base=os.path.join(cls.tmpdir.name, "chain_"))
+        cls.sender = cls.node.node_wallet.get_address()
+        # Fund the node wallet with one block reward
+        block = miner.mine_new_block(cls.node.mempool, cls.node.utxo_set, cls.node.chain, cls.sender, cls.node.consensus)
+        assert cls.node._apply_block(block)
+        main.current_node = cls.node
+        main.node_ready.set()
+        cls.client = main.flask_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        main.node_ready.clear()
+        main.current_node = None
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.node.mempool.remove_transactions(list(self.node.mempool.pending_transactions))
+
+    def _create(self, amount=1.0):
+        return self.client.post("/create-transaction", json={
+            "sender": self.sender, "recipient": "ab" * 32, "amount": amount, "fee": 0.1,
+        })
+
+    def test_queue_full_answers_503(self):
+        full = queue.Queue(maxsize=1)
+        full.put_nowait(None)
+        with mock.patch.object(main, "_tx_queue", full):
+            response = self._create()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(full.qsize(), 1)
+        self.assertEqual(len(self.node.mempool.pending_transactions), 0)
+
+    def test_accepted_status(self):
+        pending = queue.Queue()
+        with mock.patch.object(main, "_tx_queue", pending):
+            body = self._create(amount=1.0).get_json()
+        self.assertEqual(body["status"], "pending")
+        self.assertEqual(self.client.get(body["status_url"]).get_json()["status"], "pending")
+        main._submit_queued_tx(pending.get_nowait())
+        self.assertEqual(self.client.get(body["status_url"]).get_json()["status"], "accepted")
+
+    def test_rejected_status(self):
+        pending = queue.Queue()
+        with mock.patch.object(main, "_tx_queue", pending):
+            body = self._create(amount=2.0).get_json()
+        tx = pending.get_nowait()
+        self.assertTrue(self.node.mempool.add_transaction(tx)) # Already pending, so admission fails
+        main._submit_queued_tx(tx)
+        self.assertEqual(self.client.get(body["status_url"]).get_json()["status"], "rejected")
+
+    def test_unknown_id_is_404(self):
+        self.assertEqual(self.client.get("/transaction-status/" + "00" * 32).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from blockchain.mempool import Mempool
+from blockchain.transaction import Transaction
+
+
+def _tx_dict(**overrides):
+    """A well-formed one-input, one-output transaction dict as received from a peer."""
+    tx = {
+        "transaction_id": "ab" * 32,
+        "inputs": [{
+            "transaction_id": "cd" * 32,
+            "output_index": 0,
+            "unlock_script": {"public_key": "00" * 64, "signature": "00" * 64},
+        }],
+        "outputs": [{"amount": 1000, "lock_script": "ef" * 32}],
+    }
+    for path, value in overrides.items():
+        section, field = path.split("__")
+        tx[section][0][field] = value
+    return tx
+
+
+class MalformedTransactionTest(unittest.TestCase):
+    MALFORMED = {
+        "non-str input txid": {"inputs__transaction_id": 12345},
+        "short input txid": {"inputs__transaction_id": "cd"},
+        "non-int output index": {"inputs__output_index": "0"},
+        "non-str lock script": {"outputs__lock_script": 42},
+    }
+
+    def test_encoding_raises_value_error(self):
+        for name, overrides in self.MALFORMED.items():
+            with self.subTest(name):
+                tx = Transaction.from_dict(_tx_dict(**overrides))
+                with self.assertRaises(ValueError):
+                    tx.get_data_to_sign()
+
+    def test_mempool_rejects_without_raising(self):
+        for name, overrides in self.MALFORMED.items():
+            with self.subTest(name):
+                tx = Transaction.from_dict(_tx_dict(**overrides))
+                self.assertFalse(Mempool().add_transaction(tx))
+
+
+if __name__ == "__main__":
+    unittest.main()